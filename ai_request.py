@@ -1,60 +1,191 @@
+import json
 import logging
 import aiohttp  # Используем для асинхронных запросов
 import asyncio
 import config
-from data_loader import load_prompt
+import metrics
+from text_registry import text_registry
+from verdict import Verdict, parse_verdict, find_verdict_objects
 
 # Тайм-аут для нейросети (в секундах)
-NEURAL_NETWORK_TIMEOUT = 30
+NEURAL_NETWORK_TIMEOUT = getattr(config, 'NEURAL_NETWORK_TIMEOUT', 30)
 
-# Флаг для отслеживания активного запроса
-request_lock = asyncio.Lock()  # Глобальный lock
+# Сколько запросов к нейросети может выполняться одновременно
+NEURAL_NETWORK_CONCURRENCY = getattr(config, 'NEURAL_NETWORK_CONCURRENCY', 4)
 
+# Повторы при ошибках 5xx и ошибках соединения
+NEURAL_NETWORK_RETRIES = getattr(config, 'NEURAL_NETWORK_RETRIES', 2)
+NEURAL_NETWORK_BACKOFF = getattr(config, 'NEURAL_NETWORK_BACKOFF', 0.5)  # Начальная пауза, удваивается
 
-# Функция для отправки запроса к API нейросети
+# Лимит токенов ответа: вердикт - короткий JSON-объект, объяснения не нужны
+VERDICT_MAX_TOKENS = getattr(config, 'VERDICT_MAX_TOKENS', 48)
+
+API_ERROR_RESPONSE = "Ошибка при проверке сообщения на нарушение правил."
+CONNECTION_ERROR_RESPONSE = "Ошибка при подключении к нейросети."
+
+
+class ModerationClient:
+    """
+    Долгоживущий клиент нейросети: одна сессия с keep-alive пулом соединений
+    и ограничение на число одновременных запросов.
+    """
+
+    def __init__(self, url, token, concurrency=NEURAL_NETWORK_CONCURRENCY, timeout=NEURAL_NETWORK_TIMEOUT,
+                 retries=NEURAL_NETWORK_RETRIES, backoff=NEURAL_NETWORK_BACKOFF):
+        self.url = url
+        self.token = token
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._semaphore = None
+
+    # Сессия создаётся лениво, внутри работающего event loop
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f"Bearer {self.token}"
+                }
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def complete(self, payload, is_complete=None):
+        """
+        Текст ответа нейросети. При потоковом ответе чтение прекращается, как только
+        is_complete(текст) вернёт True, - остаток генерации не ждём.
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                last_attempt = attempt == self.retries
+                try:
+                    with metrics.llm_latency.time():
+                        async with session.post(self.url, json=payload) as response:
+                            if response.status == 200:
+                                if response.content_type == 'text/event-stream':
+                                    content = await self._read_stream(response, is_complete)
+                                else:
+                                    result = await response.json()
+                                    content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+                                metrics.llm_requests.inc(status='ok')
+                                return content
+                            error_text = await response.text()
+                    metrics.llm_requests.inc(status=f'http_{response.status}')
+                    if response.status < 500 or last_attempt:
+                        logging.error(f"Ошибка API: {response.status} - {error_text}")
+                        return API_ERROR_RESPONSE
+                    logging.warning(f"Ошибка API: {response.status}, повтор #{attempt + 1}")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    metrics.llm_requests.inc(status='connection_error')
+                    if last_attempt:
+                        logging.error(f"Ошибка при запросе к API нейросети: {e!r}")
+                        return CONNECTION_ERROR_RESPONSE
+                    logging.warning(f"Ошибка соединения с нейросетью: {e!r}, повтор #{attempt + 1}")
+                except Exception as e:
+                    metrics.llm_requests.inc(status='error')
+                    logging.error(f"Ошибка при запросе к API нейросети: {e}")
+                    return CONNECTION_ERROR_RESPONSE
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    # Потоковый ответ (SSE): строки "data: {...}" с очередным фрагментом текста, в конце "data: [DONE]"
+    async def _read_stream(self, response, is_complete):
+        content = ""
+        async for line in response.content:
+            line = line.strip()
+            if not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip()
+            if data == b'[DONE]':
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            content += choices[0].get("delta", {}).get("content") or ""
+            if is_complete is not None and is_complete(content):
+                # Вердикт уже получен: закрываем соединение, и сервер прекращает генерацию
+                metrics.llm_early_exits.inc()
+                response.close()
+                break
+        return content
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+moderation_client = ModerationClient(config.SECRET_API_URL, config.SECRET_API_TOKEN)
+
+
+def is_error_response(response):
+    return response in (API_ERROR_RESPONSE, CONNECTION_ERROR_RESPONSE)
+
+
+# Выбор системного промпта в зависимости от типа чата
+def get_prompt(chat_type):
+    return text_registry.prompt(chat_type)
+
+
+# Версия промпта - короткий хэш его содержимого (вместе с форматами ответа:
+# в кэш попадают вердикты и одиночных, и пакетных запросов)
+def get_prompt_version(chat_type):
+    return (f"{text_registry.prompt_version(chat_type)}:{text_registry.prompt_version('format')}:"
+            f"{text_registry.prompt_version('batch')}")
+
+
+# Системный промпт типа чата с форматом ответа: 'format' - один JSON-вердикт,
+# 'batch' - по JSON-вердикту с номером на каждое сообщение пакета
+def get_verdict_prompt(chat_type, response_format='format'):
+    return f"{get_prompt(chat_type)}\n\n{text_registry.prompt(response_format)}"
+
+
+def build_payload(prompt, user_message, max_tokens=VERDICT_MAX_TOKENS):
+    return {
+        "model": "Meta-Llama-3.1-8B-Instruct",
+        "messages": [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": ""}
+        ],
+        "repetition_penalty": 1.1,
+        "temperature": 0.4,  # Влияет на креативность от 0.1 до 0.9
+        "top_p": 0.9,
+        "top_k": 40,
+        "max_tokens": max_tokens,
+        "stream": True
+    }
+
+
+# Функция для отправки запроса к API нейросети. Возвращает Verdict
 async def generate_response(user_message, chat_type):
-    # Захватываем блокировку перед выполнением запроса
-    async with request_lock:
-        logging.info(f"Отправляем запрос к API нейросети... по сообщению: {user_message}")
-
-        # В зависимости от chat_type, используем разные промпты
-        if chat_type == 'глобальный':
-            prompt = load_prompt('texts/prompt_global.txt')
-        elif chat_type == 'торговый':
-            prompt = load_prompt('texts/prompt_trade.txt')
-        else:
-            prompt = load_prompt('texts/default_prompt.txt')
-
-        payload = {
-            "model": "Meta-Llama-3.1-8B-Instruct",
-            "messages": [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": user_message},
-                {"role": "assistant", "content": ""}
-            ],
-            "repetition_penalty": 1.1,
-            "temperature": 0.4,  # Влияет на креативность от 0.1 до 0.9
-            "top_p": 0.9,
-            "top_k": 40,
-            "max_tokens": 1024,
-            "stream": False
-        }
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f"Bearer {config.SECRET_API_TOKEN}"
-        }
-
-        # Асинхронный запрос к API
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(config.SECRET_API_URL, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    else:
-                        logging.error(f"Ошибка API: {response.status} - {await response.text()}")
-                        return "Ошибка при проверке сообщения на нарушение правил."
-            except Exception as e:
-                logging.error(f"Ошибка при запросе к API нейросети: {e}")
-                return "Ошибка при подключении к нейросети."
+    logging.info(f"Отправляем запрос к API нейросети... по сообщению: {user_message}")
+    payload = build_payload(get_verdict_prompt(chat_type), user_message)
+    # Достаточно первого полного JSON-объекта
+    response = await moderation_client.complete(
+        payload, is_complete=lambda text: '}' in text and parse_verdict(text) is not None)
+    if is_error_response(response):
+        return Verdict.failed(response)
+
+    verdict = parse_verdict(response)
+    if verdict is None:
+        logging.error(f"Не удалось разобрать ответ нейросети: {response}")
+        return Verdict.failed(API_ERROR_RESPONSE, raw=response)
+    verdict.raw = response
+    return verdict
+
+
+# Проверка нескольких сообщений одним запросом. Сообщения нумеруются,
+# нейросеть отвечает по JSON-объекту на каждое: {"n": N, "violation": ...}
+async def generate_batch_response(user_messages, chat_type):
+    logging.info(f"Отправляем пакетный запрос к API нейросети: {len(user_messages)} сообщений")
+    prompt = get_verdict_prompt(chat_type, 'batch')
+    numbered = "\n".join(f"{i}. {message}" for i, message in enumerate(user_messages, 1))
+    count = len(user_messages)
+    payload = build_payload(prompt, numbered, max_tokens=VERDICT_MAX_TOKENS * count)
+    return await moderation_client.complete(
+        payload, is_complete=lambda text: text.count('}') >= count and len(find_verdict_objects(text)) >= count)
@@ -0,0 +1,86 @@
+"""
+Сравнение проверки сообщения по спискам слов: построчный поиск `in` против автомата Ахо-Корасик.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_keywords.py --terms 10000 --lines 5000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import KeywordMatcher
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def random_word(rng, min_length, max_length):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(min_length, max_length)))
+
+
+def random_line(rng):
+    return ' '.join(random_word(rng, 2, 9) for _ in range(rng.randint(3, 15)))
+
+
+def linear_check(line, whitelist, notification_keywords, keywords):
+    if any(word in line for word in whitelist):
+        return 'whitelist'
+    for word in notification_keywords:
+        if word in line:
+            return 'notification'
+    if any(word in line for word in keywords):
+        return 'banned'
+    return None
+
+
+def matcher_check(line, matcher):
+    matches = matcher.search(line)
+    for name in ('whitelist', 'notification', 'banned'):
+        if name in matches:
+            return name
+    return None
+
+
+def measure(function, lines):
+    start = time.perf_counter()
+    results = [function(line) for line in lines]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--terms', type=int, default=10000, help='Количество запрещённых слов')
+    parser.add_argument('--lines', type=int, default=5000, help='Количество сообщений')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Длинные слова, чтобы большинство сообщений проходило все списки целиком - худший случай для `in`
+    keywords = [random_word(rng, 5, 10) for _ in range(args.terms)]
+    notification_keywords = [random_word(rng, 5, 8) for _ in range(20)]
+    whitelist = [random_word(rng, 8, 12) for _ in range(5)]
+    lines = [random_line(rng) for _ in range(args.lines)]
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher({'whitelist': whitelist, 'notification': notification_keywords, 'banned': keywords})
+    build_time = time.perf_counter() - start
+
+    linear_time, linear_results = measure(lambda line: linear_check(line, whitelist, notification_keywords, keywords), lines)
+    matcher_time, matcher_results = measure(lambda line: matcher_check(line, matcher), lines)
+
+    if linear_results != matcher_results:
+        sys.exit("Результаты проверки не совпадают!")
+
+    hits = sum(result is not None for result in matcher_results)
+    print(f"Слов: {args.terms}, сообщений: {args.lines}, срабатываний: {hits}")
+    print(f"Построение автомата: {build_time * 1000:.1f} мс")
+    print(f"Линейный поиск:  {linear_time / args.lines * 1e6:10.1f} мкс/сообщение")
+    print(f"Ахо-Корасик:     {matcher_time / args.lines * 1e6:10.1f} мкс/сообщение")
+    print(f"Ускорение: x{linear_time / matcher_time:.1f}")
+
+
+if __name__ == '__main__':
+    main()
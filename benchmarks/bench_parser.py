@@ -0,0 +1,99 @@
+"""
+Скорость разбора лог-файла клиента: старый вариант (re.compile на каждой строке)
+против chat_parser.parse_line с быстрым отсевом строк без чата.
+
+Запуск из корня репозитория на записанном логе:
+    python benchmarks/bench_parser.py path/to/fml-client-latest.log
+или на сгенерированном (по умолчанию ~20 МБ, 5% строк - чат):
+    python benchmarks/bench_parser.py --size-mb 20 --chat-ratio 0.05
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_parser import parse_line
+
+NOISE_LINES = [
+    "[{t}] [Client thread/INFO] [FML/]: Loading texture atlas for mod {n}",
+    "[{t}] [Client thread/WARN] [net.minecraft.client.renderer.texture.TextureMap/]: Texture {n} with size 17x17 limits mip level",
+    "[{t}] [Netty Client IO #{n}/INFO] [FML/]: Server protocol version {n}",
+    "[{t}] [Client thread/INFO] [STDOUT/]: [com.example.mod.Handler:tick:{n}]: chunk -> {n} loaded",
+    "[{t}] [Sound Library Loader/INFO] [minecraft/SoundManager]: Sound engine started",
+]
+CHAT_LINES = [
+    "[{t}] [Client thread/INFO] [STDOUT/]: [Глобальный] Player{n} -> §7 продам меч недорого",
+    "[{t}] [Client thread/INFO] [STDOUT/]: [Торговый] Trader{n} -> §7 куплю алмазы",
+    "[{t}] [Client thread/INFO] [STDOUT/]: [Общий] Some{n} -> §f привет всем",
+]
+
+
+def old_parse(line):
+    chat_message_pattern = re.compile(
+        r'\[\d+:\d+:\d+\] \[.+?\] \[.+?\/\]: \[(?!System)(.+?)\] (.+?) -> .*? (.+)')
+    match = chat_message_pattern.search(line)
+    if match:
+        return match.group(1), match.group(2), match.group(3)
+    return None
+
+
+def new_parse(line):
+    chat_line = parse_line(line, 'bench')
+    if chat_line is not None:
+        return chat_line.channel, chat_line.player, chat_line.message
+    return None
+
+
+def generate_lines(size_mb, chat_ratio, seed):
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        templates = CHAT_LINES if rng.random() < chat_ratio else NOISE_LINES
+        t = f"{rng.randint(0, 23):02}:{rng.randint(0, 59):02}:{rng.randint(0, 59):02}"
+        line = rng.choice(templates).format(t=t, n=rng.randint(1, 9999))
+        lines.append(line)
+        size += len(line.encode('cp1251')) + 1
+    return lines
+
+
+def measure(function, lines):
+    start = time.perf_counter()
+    results = [function(line) for line in lines]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log', nargs='?', help='Записанный лог клиента (cp1251)')
+    parser.add_argument('--size-mb', type=float, default=20)
+    parser.add_argument('--chat-ratio', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.log:
+        with open(args.log, 'r', encoding='cp1251', errors='replace') as f:
+            lines = f.read().splitlines()
+    else:
+        lines = generate_lines(args.size_mb, args.chat_ratio, args.seed)
+
+    size_mb = sum(len(line) + 1 for line in lines) / 1024 / 1024
+    old_time, old_results = measure(old_parse, lines)
+    new_time, new_results = measure(new_parse, lines)
+
+    if old_results != new_results:
+        sys.exit("Результаты разбора не совпадают!")
+
+    chat = sum(result is not None for result in new_results)
+    print(f"Строк: {len(lines)} ({size_mb:.1f} МБ), сообщений чата: {chat}")
+    print(f"Старый разбор: {len(lines) / old_time:12,.0f} строк/с")
+    print(f"chat_parser:   {len(lines) / new_time:12,.0f} строк/с")
+    print(f"Ускорение: x{old_time / new_time:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import re
+import time
+from datetime import datetime
+
+# Строка чата в логе клиента:
+# [12:34:56] [Client thread/INFO] [STDOUT/]: [Глобальный] Player -> §7сообщение
+chat_message_pattern = re.compile(
+    r'\[(\d+:\d+:\d+)\] \[.+?\] \[.+?\/\]: \[(?!System)(.+?)\] (.+?) -> .*? (.+)')
+
+# Подстроки, без которых строка точно не совпадёт с шаблоном.
+# Проверка `in` намного дешевле регулярного выражения, а чат - малая доля строк лога
+CHAT_MARKERS = ('/]: [', ' -> ')
+
+
+class ChatLine:
+    __slots__ = ('timestamp', 'channel', 'player', 'message', 'server')
+
+    def __init__(self, timestamp, channel, player, message, server):
+        self.timestamp = timestamp
+        self.channel = channel
+        self.player = player
+        self.message = message
+        self.server = server
+
+    def __repr__(self):
+        return f"ChatLine({self.timestamp} {self.server} [{self.channel}] {self.player}: {self.message})"
+
+
+# Разбор строки лога. Возвращает ChatLine или None, если это не сообщение чата
+def parse_line(line, server):
+    if CHAT_MARKERS[0] not in line or CHAT_MARKERS[1] not in line:
+        return None
+
+    match = chat_message_pattern.search(line)
+    if match is None:
+        return None
+    return ChatLine(match.group(1), match.group(2), match.group(3), match.group(4), server)
+
+
+DAY = 24 * 60 * 60
+
+
+class LogClock:
+    """
+    Время строк лога одного сервера в секундах Unix. В логе записано только ЧЧ:ММ:СС,
+    поэтому дата отсчитывается от момента запуска и сдвигается при переходе через полночь.
+    Окна вроде "5 сообщений за 10 секунд" считаются по этому времени, а не по времени обработки:
+    накопившиеся строки (после перезапуска, при очереди, в replay) обрабатываются пачкой.
+    """
+
+    def __init__(self):
+        self._day_start = None
+        self._last = None
+
+    def seconds(self, timestamp):
+        hours, minutes, seconds = timestamp.split(':')
+        of_day = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+        if self._day_start is None:
+            now = datetime.now()
+            self._day_start = time.mktime(now.replace(hour=0, minute=0, second=0, microsecond=0).timetuple())
+            # Строка "из будущего" записана вчера, до полуночи
+            if of_day > now.hour * 3600 + now.minute * 60 + now.second + 60:
+                self._day_start -= DAY
+        elif of_day < self._last - DAY / 2:
+            self._day_start += DAY
+        elif of_day > self._last + DAY / 2:
+            # Строка до полуночи, обработанная после строки следующего дня
+            return self._day_start - DAY + of_day
+        self._last = of_day
+        return self._day_start + of_day
@@ -0,0 +1,121 @@
+import os
+import glob
+import gzip
+import json
+import time
+import asyncio
+import logging
+import config
+from log_tailer import TailOffsetStore, TAIL_OFFSETS_FILE
+from log_monitor import recent_messages, tail_offsets
+from verdict_cache import verdict_cache
+from ai_request import get_prompt_version
+
+# Файл контрольной точки (None - не сохранять состояние между перезапусками) и как часто его обновлять (в секундах)
+CHECKPOINT_FILE = getattr(config, 'CHECKPOINT_FILE', 'checkpoint.json.gz')
+CHECKPOINT_INTERVAL = getattr(config, 'CHECKPOINT_INTERVAL', 30)
+
+CHECKPOINT_VERSION = 1
+
+
+def collect_state():
+    """
+    Снимок состояния для контрольной точки. Вызывается в event loop, поэтому
+    копирует только данные в памяти, а сериализация и запись идут в отдельном потоке.
+    """
+    return {
+        "version": CHECKPOINT_VERSION,
+        "saved_at": time.time(),
+        "players": recent_messages.snapshot(),
+        "verdicts": verdict_cache.snapshot()
+    }
+
+
+def write_checkpoint(state, filename=CHECKPOINT_FILE):
+    tmp_filename = filename + '.tmp'
+    # Быстрое сжатие: снимок пишется каждые CHECKPOINT_INTERVAL секунд
+    with gzip.open(tmp_filename, 'wt', encoding='utf-8', compresslevel=3) as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_filename, filename)
+
+
+def read_checkpoint(filename=CHECKPOINT_FILE):
+    with gzip.open(filename, 'rt', encoding='utf-8') as f:
+        state = json.load(f)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"неизвестная версия {state.get('version')}")
+    return state
+
+
+def save_checkpoint():
+    """Сохранение состояния при остановке. Без контрольной точки - в отдельные файлы, как раньше."""
+    tail_offsets.save()
+    if not CHECKPOINT_FILE:
+        verdict_cache.save()
+        return
+    start = time.perf_counter()
+    state = collect_state()
+    try:
+        write_checkpoint(state)
+    except Exception as e:
+        logging.error(f"Ошибка при сохранении контрольной точки: {e}")
+        return
+    logging.info(f"Контрольная точка сохранена за {time.perf_counter() - start:.2f} с: "
+                 f"игроков {len(state['players'])}, вердиктов {len(state['verdicts'])}")
+
+
+def restore_offsets(state=None):
+    """
+    Позиции чтения логов. Они сохраняются в отдельный файл каждые TAIL_OFFSETS_SAVE_INTERVAL
+    секунд, а не с контрольной точкой: после сбоя повторно обрабатывается лишь несколько строк.
+    Контрольная точка прежней версии хранила позиции сама - тогда они новее файла.
+    Без файла позиции берутся из файлов отдельных процессов чтения (tail_offsets.<сервер>.json).
+    """
+    tail_offsets.filename = TAIL_OFFSETS_FILE
+    if state and "offsets" in state:
+        tail_offsets.restore(state["offsets"])
+        return
+    if os.path.exists(TAIL_OFFSETS_FILE):
+        tail_offsets.load()
+        return
+    base, extension = os.path.splitext(TAIL_OFFSETS_FILE)
+    for filename in sorted(glob.glob(f"{glob.escape(base)}.*{extension}")):
+        tail_offsets.restore(TailOffsetStore(filename).snapshot())
+
+
+def restore_checkpoint():
+    """Восстановление состояния при запуске; вызывается до запуска чтения логов."""
+    if not CHECKPOINT_FILE or not os.path.exists(CHECKPOINT_FILE):
+        # Без контрольной точки кэш вердиктов хранится в отдельном файле, как раньше
+        restore_offsets()
+        verdict_cache.load(get_prompt_version)
+        return
+
+    start = time.perf_counter()
+    try:
+        state = read_checkpoint()
+        restore_offsets(state)
+        recent_messages.restore(state["players"])
+        verdict_cache.restore(state["verdicts"], get_prompt_version)
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке контрольной точки {CHECKPOINT_FILE}: {e}")
+        if tail_offsets.filename is None:
+            # Позиции хранятся отдельно и от ошибки в контрольной точке не зависят
+            restore_offsets()
+        return
+    logging.info(f"Состояние восстановлено за {time.perf_counter() - start:.2f} с "
+                 f"(контрольная точка {time.time() - state['saved_at']:.0f} с назад): "
+                 f"позиций {len(tail_offsets.snapshot())}, игроков {len(recent_messages)}, "
+                 f"вердиктов {verdict_cache.stats()['size']}")
+
+
+async def run_checkpointer(interval=CHECKPOINT_INTERVAL):
+    if not CHECKPOINT_FILE:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        state = collect_state()
+        try:
+            await asyncio.to_thread(write_checkpoint, state)
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении контрольной точки: {e}")
@@ -0,0 +1,433 @@
+"""
+Журнал модерации: каждое разобранное сообщение чата, путь его проверки
+(белый список, ключевые слова, кэш, нейросеть...), вердикт, ответ нейросети и время обработки.
+Сообщения, выброшенные очередью при переполнении, записываются с путём dropped.
+
+Записи дописываются в JSONL-сегменты по часам (UTC), сегмент больше JOURNAL_SEGMENT_SIZE
+продолжается в следующем файле того же часа. Рядом с каждым сегментом лежит маленький индекс
+(.idx.json): интервал времени, игроки, каналы, серверы и число нарушений. Поиск отбрасывает
+сегменты по имени и индексу и читает только подходящие файлы.
+
+Поиск и выгрузка (из корня репозитория):
+    python event_journal.py query --player Steve --since 1h
+    python event_journal.py query --channel глобальный --verdict violation --since 2026-10-01 --until 2026-10-02
+    python event_journal.py export --path llm --since 7d > training.jsonl
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import calendar
+import threading
+from collections import deque
+from datetime import datetime
+import config
+
+# Каталог журнала (None - не вести журнал)
+JOURNAL_DIR = getattr(config, 'JOURNAL_DIR', 'journal')
+
+# Размер сегмента, после которого начинается следующий файл, и общий предел размера журнала
+# (старые сегменты удаляются; None - хранить всё)
+JOURNAL_SEGMENT_SIZE = getattr(config, 'JOURNAL_SEGMENT_SIZE', 64 * 1024 * 1024)
+JOURNAL_MAX_SIZE = getattr(config, 'JOURNAL_MAX_SIZE', 20 * 1024 * 1024 * 1024)
+
+# Как часто записывать накопленные события (в секундах) и сколько держать в памяти при проблемах с диском
+JOURNAL_FLUSH_INTERVAL = getattr(config, 'JOURNAL_FLUSH_INTERVAL', 1.0)
+JOURNAL_MAX_PENDING = 100000
+
+BUCKET_SECONDS = 60 * 60
+SEGMENT_SUFFIX = '.jsonl'
+INDEX_SUFFIX = '.idx.json'
+
+# 20261018-12.jsonl, 20261018-12.1.jsonl, ...
+segment_name_pattern = re.compile(r'^(\d{8}-\d{2})(?:\.(\d+))?\.jsonl$')
+relative_time_pattern = re.compile(r'^(\d+(?:\.\d+)?)([smhd])$')
+
+
+def bucket_name(timestamp):
+    return time.strftime('%Y%m%d-%H', time.gmtime(timestamp))
+
+
+def bucket_start(name):
+    return calendar.timegm(time.strptime(name, '%Y%m%d-%H'))
+
+
+def is_violation_record(record):
+    verdict = record.get("verdict")
+    return bool(verdict and verdict.get("violation")) or record.get("path") in ('keyword', 'flood')
+
+
+class SegmentIndex:
+    """Сводка по сегменту, по которой поиск решает, читать ли файл."""
+
+    def __init__(self, start=None, end=None, count=0, players=(), channels=(), servers=(), paths=(), violations=0):
+        self.start = start
+        self.end = end
+        self.count = count
+        self.players = set(players)
+        self.channels = set(channels)
+        self.servers = set(servers)
+        self.paths = set(paths)
+        self.violations = violations
+
+    def add(self, record):
+        timestamp = record["ts"]
+        self.start = timestamp if self.start is None else min(self.start, timestamp)
+        self.end = timestamp if self.end is None else max(self.end, timestamp)
+        self.count += 1
+        self.players.add(record["player"].lower())
+        self.channels.add(record["channel"].lower())
+        self.servers.add(record["server"])
+        self.paths.add(record["path"])
+        self.violations += is_violation_record(record)
+
+    def matches(self, filters):
+        if not self.count:
+            return False
+        if filters.since is not None and self.end < filters.since:
+            return False
+        if filters.until is not None and self.start > filters.until:
+            return False
+        if filters.player is not None and filters.player.lower() not in self.players:
+            return False
+        if filters.channel is not None and filters.channel.lower() not in self.channels:
+            return False
+        if filters.server is not None and filters.server not in self.servers:
+            return False
+        if filters.path is not None and filters.path not in self.paths:
+            return False
+        if filters.verdict == 'violation' and not self.violations:
+            return False
+        return True
+
+    def to_dict(self):
+        return {
+            "start": self.start,
+            "end": self.end,
+            "count": self.count,
+            "players": sorted(self.players),
+            "channels": sorted(self.channels),
+            "servers": sorted(self.servers),
+            "paths": sorted(self.paths),
+            "violations": self.violations
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def read_index(segment_path):
+    """Индекс сегмента; если его нет или он повреждён - собирается заново по самому сегменту."""
+    index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return SegmentIndex.from_dict(json.load(f))
+    except (OSError, ValueError, TypeError):
+        pass
+
+    index = SegmentIndex()
+    for record in read_segment(segment_path):
+        index.add(record)
+    return index
+
+
+def write_index(segment_path, index):
+    index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index.to_dict(), f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def read_segment(segment_path, needle=None):
+    """Записи сегмента. needle - подстрока, без которой строку можно не разбирать."""
+    with open(segment_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if needle is not None and needle not in line.lower():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # Недописанная строка после аварийной остановки
+
+
+def list_segments(directory):
+    """Сегменты журнала по времени: [(час, номер части, путь)]."""
+    segments = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    for name in names:
+        match = segment_name_pattern.match(name)
+        if match:
+            segments.append((match.group(1), int(match.group(2) or 0), os.path.join(directory, name)))
+    segments.sort()
+    return segments
+
+
+class EventJournal:
+    """
+    Журнал событий модерации. record() только добавляет запись в память;
+    запись на диск - пачками в отдельном потоке (run_flusher) и при close().
+    """
+
+    def __init__(self, directory=JOURNAL_DIR, segment_size=JOURNAL_SEGMENT_SIZE, max_size=JOURNAL_MAX_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = deque(maxlen=JOURNAL_MAX_PENDING)
+        self._segments = {}  # час -> [путь, номер части, размер, SegmentIndex]
+        self._new_segment = True  # Размер журнала проверяется только при появлении нового сегмента
+
+    def record(self, chat_line, path, verdict=None, latency=None):
+        if not self.directory:
+            return
+        record = {
+            "ts": round(time.time(), 3),
+            "time": chat_line.timestamp,
+            "server": chat_line.server,
+            "channel": chat_line.channel,
+            "player": chat_line.player,
+            "message": chat_line.message,
+            "path": path,
+            "verdict": verdict.to_dict() if verdict is not None else None,
+            # Ответ нейросети как есть - в том числе тот, который не удалось разобрать
+            "llm_output": verdict.raw if verdict is not None else None,
+            "latency": round(latency * 1000, 1) if latency is not None else None  # мс
+        }
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                # Диск не успевает: самые старые события теряются, но память не растёт
+                self.dropped += 1
+            self._pending.append(record)
+
+    def _segment(self, bucket):
+        segment = self._segments.get(bucket)
+        if segment is None:
+            # Продолжаем последнюю часть этого часа, если бот перезапускался
+            parts = [(part, path) for name, part, path in list_segments(self.directory) if name == bucket]
+            part, path = max(parts) if parts else (0, os.path.join(self.directory, bucket + SEGMENT_SUFFIX))
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            index = read_index(path) if size else SegmentIndex()
+            segment = self._segments[bucket] = [path, part, size, index]
+            self._new_segment = True
+        if segment[2] >= self.segment_size:
+            part = segment[1] + 1
+            path = os.path.join(self.directory, f"{bucket}.{part}{SEGMENT_SUFFIX}")
+            segment = self._segments[bucket] = [path, part, 0, SegmentIndex()]
+            self._new_segment = True
+        return segment
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            records, self._pending = self._pending, deque(maxlen=JOURNAL_MAX_PENDING)
+
+        with self._write_lock:
+            try:
+                self._write(records)
+            except OSError as e:
+                # Повторим при следующей записи
+                with self._lock:
+                    self._pending.extendleft(reversed(records))
+                logging.error(f"Ошибка при записи журнала событий: {e}")
+                return
+            # Сегменты прошлых часов больше не дописываются
+            current = bucket_name(time.time())
+            for bucket in [bucket for bucket in self._segments if bucket < current]:
+                del self._segments[bucket]
+        self._enforce_max_size()
+
+    def _write(self, records):
+        os.makedirs(self.directory, exist_ok=True)
+        by_bucket = {}
+        for record in records:
+            by_bucket.setdefault(bucket_name(record["ts"]), []).append(record)
+
+        for bucket, bucket_records in by_bucket.items():
+            start = 0
+            while start < len(bucket_records):
+                segment = self._segment(bucket)
+                path, _, size, index = segment
+                lines = []
+                # Пишем, пока сегмент не превысит предел, остальное - в следующую часть
+                while start < len(bucket_records) and size < self.segment_size:
+                    record = bucket_records[start]
+                    line = json.dumps(record, ensure_ascii=False) + "\n"
+                    lines.append(line)
+                    size += len(line.encode('utf-8'))
+                    index.add(record)
+                    start += 1
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+                segment[2] = size
+                write_index(path, index)
+
+    def _enforce_max_size(self):
+        if not self.max_size or not self._new_segment:
+            return
+        self._new_segment = False
+        segments = [(bucket, part, path, os.path.getsize(path)) for bucket, part, path in list_segments(self.directory)]
+        total = sum(size for _, _, _, size in segments)
+        active = {segment[0] for segment in self._segments.values()}
+        for _, _, path, size in segments:
+            if total <= self.max_size:
+                break
+            if path in active:
+                continue
+            index_path = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+            for filename in (path, index_path):
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logging.info(f"Журнал событий превысил предел, удалён сегмент {path}")
+
+    # Периодическая запись накопленных событий, не блокируя event loop
+    async def run_flusher(self, interval=JOURNAL_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush)
+
+    def close(self):
+        self.flush()
+
+
+class QueryFilters:
+    def __init__(self, player=None, since=None, until=None, channel=None, server=None, verdict=None, path=None,
+                 text=None):
+        self.player = player
+        self.since = since
+        self.until = until
+        self.channel = channel
+        self.server = server
+        self.verdict = verdict  # violation, clean или error
+        self.path = path
+        self.text = text
+
+    def matches(self, record):
+        if self.since is not None and record["ts"] < self.since:
+            return False
+        if self.until is not None and record["ts"] > self.until:
+            return False
+        if self.player is not None and record["player"].lower() != self.player.lower():
+            return False
+        if self.channel is not None and record["channel"].lower() != self.channel.lower():
+            return False
+        if self.server is not None and record["server"] != self.server:
+            return False
+        if self.path is not None and record["path"] != self.path:
+            return False
+        if self.text is not None and self.text.lower() not in record["message"].lower():
+            return False
+        if self.verdict == 'violation' and not is_violation_record(record):
+            return False
+        if self.verdict == 'clean' and (is_violation_record(record) or (record["verdict"] or {}).get("error")):
+            return False
+        if self.verdict == 'error' and not (record["verdict"] or {}).get("error"):
+            return False
+        return True
+
+
+def query(directory, filters, limit=None):
+    """Записи журнала по условиям, от старых к новым."""
+    # Самая избирательная подстрока: строки без неё не разбираются. Текст с символами,
+    # которые экранируются в JSON, так не сравнить
+    needle = filters.player
+    if needle is None and filters.text is not None and json.dumps(filters.text, ensure_ascii=False)[1:-1] == filters.text:
+        needle = filters.text
+    needle = needle.lower() if needle else None
+    found = 0
+    for bucket, _, path in list_segments(directory):
+        start = bucket_start(bucket)
+        if filters.until is not None and start > filters.until:
+            break
+        if filters.since is not None and start + BUCKET_SECONDS < filters.since:
+            continue
+        if not read_index(path).matches(filters):
+            continue
+        for record in read_segment(path, needle):
+            if filters.matches(record):
+                yield record
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+
+def parse_time(value, now=None):
+    """'90s', '30m', '1h', '7d' - столько назад; иначе дата 'YYYY-MM-DD[ HH:MM[:SS]]' по местному времени."""
+    if value is None:
+        return None
+    match = relative_time_pattern.match(value)
+    if match:
+        seconds = float(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+        return (time.time() if now is None else now) - seconds
+    return datetime.fromisoformat(value).timestamp()
+
+
+def format_record(record):
+    when = datetime.fromtimestamp(record["ts"]).strftime('%Y-%m-%d %H:%M:%S')
+    verdict = record["verdict"]
+    if verdict is None:
+        outcome = record["path"]
+    elif verdict.get("error"):
+        outcome = f"{record['path']}: ошибка"
+    elif verdict.get("violation"):
+        outcome = f"{record['path']}: нарушение {verdict.get('rule') or ''}".rstrip()
+    else:
+        outcome = f"{record['path']}: нарушений нет"
+    latency = f", {record['latency']} мс" if record.get("latency") is not None else ""
+    return f"{when} [{record['server']} {record['channel']}] {record['player']}: {record['message']}  ({outcome}{latency})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск по журналу событий модерации")
+    parser.add_argument('command', choices=('query', 'export'),
+                        help="query - вывод для модератора, export - примеры для обучения pre_classifier.py")
+    parser.add_argument('--dir', default=JOURNAL_DIR or 'journal')
+    parser.add_argument('--player')
+    parser.add_argument('--since', help="Начало: 1h, 30m, 7d или 2026-10-18 12:00")
+    parser.add_argument('--until', help="Конец, в том же формате")
+    parser.add_argument('--channel')
+    parser.add_argument('--server')
+    parser.add_argument('--verdict', choices=('violation', 'clean', 'error'))
+    parser.add_argument('--path', help="Путь проверки: whitelist, alert, keyword, flood, cache, pre_classifier, llm, dropped, ...")
+    parser.add_argument('--text', help="Подстрока сообщения")
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--json', action='store_true', help="Выводить записи как есть, в JSONL")
+    args = parser.parse_args()
+
+    filters = QueryFilters(args.player, parse_time(args.since), parse_time(args.until), args.channel, args.server,
+                           args.verdict, args.path, args.text)
+    try:
+        for record in query(args.dir, filters, args.limit):
+            if args.command == 'export':
+                # Только сообщения с вердиктом нейросети, в формате --data для pre_classifier.py
+                verdict = record["verdict"]
+                if verdict and not verdict.get("error") and record["path"] in ('llm', 'cache'):
+                    print(json.dumps({"message": record["message"], "chat_type": record["channel"].lower(),
+                                      "violation": bool(verdict.get("violation"))}, ensure_ascii=False))
+            elif args.json:
+                print(json.dumps(record, ensure_ascii=False))
+            else:
+                print(format_record(record))
+    except BrokenPipeError:
+        sys.stderr.close()  # Вывод обрезан (например, | head)
+
+
+event_journal = EventJournal()
+
+
+if __name__ == '__main__':
+    main()
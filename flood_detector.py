@@ -0,0 +1,217 @@
+import time
+import zlib
+from collections import OrderedDict, deque
+import config
+import metrics
+
+# Частые сообщения одного игрока: не больше FLOOD_RATE_COUNT за FLOOD_RATE_WINDOW секунд
+FLOOD_RATE_WINDOW = getattr(config, 'FLOOD_RATE_WINDOW', 10)
+FLOOD_RATE_COUNT = getattr(config, 'FLOOD_RATE_COUNT', 5)
+
+# Однотипные сообщения одного игрока (п. 2.5: не более 2-х раз в 3 минуты)
+FLOOD_DUPLICATE_WINDOW = getattr(config, 'FLOOD_DUPLICATE_WINDOW', 3 * 60)
+FLOOD_DUPLICATE_COUNT = getattr(config, 'FLOOD_DUPLICATE_COUNT', 3)
+
+# Насколько похожими (доля общих трёхсимвольных фрагментов) должны быть сообщения, чтобы считаться однотипными
+FLOOD_SIMILARITY = getattr(config, 'FLOOD_SIMILARITY', 0.7)
+
+# Волна одинаковых сообщений от разных игроков на любых серверах. Короткие сообщения
+# ("го", "привет") не учитываются - их одновременно пишут и без сговора
+RAID_WINDOW = getattr(config, 'RAID_WINDOW', 60)
+RAID_PLAYERS = getattr(config, 'RAID_PLAYERS', 3)
+RAID_MIN_LENGTH = getattr(config, 'RAID_MIN_LENGTH', 12)
+
+# Ограничения памяти: сообщений на игрока, игроков и одновременно отслеживаемых волн
+FLOOD_HISTORY = 30
+FLOOD_MAX_PLAYERS = getattr(config, 'FLOOD_MAX_PLAYERS', 5000)
+RAID_MAX_BURSTS = 2000
+
+SHINGLE_SIZE = 3
+
+# Хэш-функции MinHash вида (a * x + b) mod p; по каждой значению строится отдельный индекс
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_PARAMS = ((0x9E3779B97F4A7C15, 0x7F4A7C15), (0xBF58476D1CE4E5B9, 0x1CE4E5B9),
+                   (0x94D049BB133111EB, 0x133111EB), (0xD6E8FEB86659FD93, 0x6659FD93))
+
+
+def shingles(normalized):
+    """Хэши трёхсимвольных фрагментов нормализованного сообщения."""
+    if len(normalized) <= SHINGLE_SIZE:
+        return frozenset((zlib.crc32(normalized.encode('utf-8')),))
+    return frozenset(zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode('utf-8'))
+                     for i in range(len(normalized) - SHINGLE_SIZE + 1))
+
+
+def similarity(first, second):
+    common = len(first & second)
+    return common / (len(first) + len(second) - common)
+
+
+def minhash(shingle_set):
+    return tuple(min((a * value + b) % _MINHASH_PRIME for value in shingle_set) for a, b in _MINHASH_PARAMS)
+
+
+class FloodEvent:
+    """
+    Сообщение - часть флуда. alert=True только у сообщения, с которого волна началась:
+    по нему отправляется одно общее уведомление, остальные просто пропускаются.
+    """
+    __slots__ = ('kind', 'alert', 'description')
+
+    def __init__(self, kind, alert, description):
+        self.kind = kind  # rate, duplicate или raid
+        self.alert = alert
+        self.description = description
+
+
+class _PlayerState:
+    __slots__ = ('messages', 'kind', 'flooding_until')
+
+    def __init__(self):
+        self.messages = deque(maxlen=FLOOD_HISTORY)  # (время, фрагменты)
+        self.kind = None
+        self.flooding_until = 0.0
+
+
+class _Burst:
+    __slots__ = ('shingles', 'signature', 'last_seen', 'players', 'servers', 'count', 'alerted')
+
+    def __init__(self, shingle_set, signature, now, player, server):
+        self.shingles = shingle_set
+        self.signature = signature
+        self.last_seen = now
+        self.players = {player: None}  # упорядоченное множество
+        self.servers = {server: None}
+        self.count = 1
+        self.alerted = False
+
+
+class FloodDetector:
+    """
+    Скользящие окна сообщений каждого игрока и общий детектор волн похожих сообщений.
+    Похожесть считается по трёхсимвольным фрагментам нормализованного текста, кандидаты
+    для волн ищутся по MinHash-подписям, так что проверка не перебирает все недавние сообщения.
+    Пока флуд игрока продолжается, его сообщения не проверяются нейросетью. Волна от разных
+    игроков даёт одно уведомление, а сами сообщения проверяются как обычно: нарушения
+    каждого игрока (например, в торговом чате) не должны теряться.
+    """
+
+    def __init__(self):
+        self._players = OrderedDict()  # игрок -> _PlayerState, от давно писавших к активным
+        self._bursts = OrderedDict()  # _Burst -> None, от давно обновлённых к свежим
+        self._index = {}  # (номер хэш-функции, значение) -> _Burst
+        self._player_ttl = max(FLOOD_RATE_WINDOW, FLOOD_DUPLICATE_WINDOW)
+
+    def check(self, player, normalized, server, now=None):
+        """
+        FloodEvent, если сообщение - часть флуда, иначе None.
+        normalized - сообщение после text_normalizer.normalize.
+        """
+        now = time.time() if now is None else now
+        shingle_set = shingles(normalized)
+        raid = self._check_raid(player, server, normalized, shingle_set, now)
+        flood = self._check_player(player, shingle_set, now)
+        # Флуд игрока внутри только что замеченной волны отдельного уведомления не требует
+        if raid is not None and (raid.alert or flood is None):
+            return raid
+        return flood
+
+    def _window(self, kind):
+        return FLOOD_RATE_WINDOW if kind == 'rate' else FLOOD_DUPLICATE_WINDOW
+
+    def _check_player(self, player, shingle_set, now):
+        state = self._players.get(player)
+        if state is None:
+            state = self._players[player] = _PlayerState()
+        else:
+            self._players.move_to_end(player)
+        messages = state.messages
+        while messages and messages[0][0] < now - FLOOD_DUPLICATE_WINDOW:
+            messages.popleft()
+        messages.append((now, shingle_set))
+        self._evict_players(now)
+
+        if state.flooding_until > now:
+            # Флуд продолжается, пока игрок не замолчит на время окна
+            state.flooding_until = now + self._window(state.kind)
+            return FloodEvent(state.kind, False, "флуд продолжается")
+
+        rate = sum(1 for timestamp, _ in messages if timestamp >= now - FLOOD_RATE_WINDOW)
+        if rate >= FLOOD_RATE_COUNT:
+            kind, description = 'rate', f"сообщений за {FLOOD_RATE_WINDOW} с: {rate}"
+        else:
+            duplicates = sum(1 for _, previous in messages if similarity(previous, shingle_set) >= FLOOD_SIMILARITY)
+            if duplicates < FLOOD_DUPLICATE_COUNT:
+                return None
+            kind, description = 'duplicate', f"однотипных сообщений за {FLOOD_DUPLICATE_WINDOW} с: {duplicates}"
+
+        state.kind = kind
+        state.flooding_until = now + self._window(kind)
+        metrics.flood_events.inc(kind=kind)
+        return FloodEvent(kind, True, description)
+
+    def _evict_players(self, now):
+        players = self._players
+        while len(players) > FLOOD_MAX_PLAYERS:
+            players.popitem(last=False)
+        while players:
+            oldest = next(iter(players.values()))
+            if oldest.messages and oldest.messages[-1][0] >= now - self._player_ttl:
+                break
+            players.popitem(last=False)
+
+    def _check_raid(self, player, server, normalized, shingle_set, now):
+        self._expire_bursts(now)
+        if len(normalized) < RAID_MIN_LENGTH:
+            return None
+
+        signature = minhash(shingle_set)
+        burst = None
+        for key in enumerate(signature):
+            candidate = self._index.get(key)
+            if candidate is not None and similarity(candidate.shingles, shingle_set) >= FLOOD_SIMILARITY:
+                burst = candidate
+                break
+
+        if burst is None:
+            burst = _Burst(shingle_set, signature, now, player, server)
+            self._bursts[burst] = None
+            for key in enumerate(signature):
+                self._index.setdefault(key, burst)
+            if len(self._bursts) > RAID_MAX_BURSTS:
+                self._remove_burst(next(iter(self._bursts)))
+            return None
+
+        burst.last_seen = now
+        burst.count += 1
+        burst.players[player] = None
+        burst.servers[server] = None
+        self._bursts.move_to_end(burst)
+
+        if burst.alerted:
+            return FloodEvent('raid', False, "волна продолжается")
+        if len(burst.players) < RAID_PLAYERS:
+            return None
+
+        burst.alerted = True
+        metrics.flood_events.inc(kind='raid')
+        players = list(burst.players)
+        shown = ", ".join(players[:10]) + (f" и ещё {len(players) - 10}" if len(players) > 10 else "")
+        return FloodEvent('raid', True, f"одинаковых сообщений: {burst.count}, игроков: {len(players)} "
+                                        f"({', '.join(burst.servers)}) - {shown}")
+
+    def _expire_bursts(self, now):
+        while self._bursts:
+            oldest = next(iter(self._bursts))
+            if oldest.last_seen >= now - RAID_WINDOW:
+                break
+            self._remove_burst(oldest)
+
+    def _remove_burst(self, burst):
+        del self._bursts[burst]
+        for key in enumerate(burst.signature):
+            if self._index.get(key) is burst:
+                del self._index[key]
+
+
+flood_detector = FloodDetector()
@@ -0,0 +1,71 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Автомат Ахо-Корасик по всем спискам слов сразу. За один проход по сообщению
+    находит, какие списки сработали и на каких словах.
+    """
+
+    def __init__(self, lists):
+        """
+        :param lists: Словарь {название списка: список слов}
+        """
+        self.lists = {name: list(words) for name, words in lists.items()}
+        self._goto = [{}]  # Переходы по символу для каждого узла
+        self._fail = [0]  # Суффиксные ссылки
+        self._out = [()]  # Слова, заканчивающиеся в узле: (название списка, индекс в списке, слово)
+        self._build()
+
+    def _build(self):
+        goto, fail, out = self._goto, self._fail, self._out
+
+        for name, words in self.lists.items():
+            for index, word in enumerate(words):
+                if not word:
+                    continue
+                node = 0
+                for char in word:
+                    next_node = goto[node].get(char)
+                    if next_node is None:
+                        next_node = len(goto)
+                        goto[node][char] = next_node
+                        goto.append({})
+                        fail.append(0)
+                        out.append(())
+                    node = next_node
+                out[node] += ((name, index, word),)
+
+        # Обход в ширину: суффиксные ссылки и объединение выходов
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                out[child] += out[fail[child]]
+
+    def search(self, text):
+        """
+        Возвращает {название списка: [слова]} для всех сработавших списков.
+        Слова идут в порядке их следования в исходном списке.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+
+        result = {}
+        for name, index, word in sorted(found):
+            words = result.setdefault(name, [])
+            if word not in words:
+                words.append(word)
+        return result
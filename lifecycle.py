@@ -0,0 +1,133 @@
+import time
+import signal
+import asyncio
+import logging
+import config
+from log_monitor import monitor_log, report_queue_stats, message_queues, tail_offsets
+from ai_request import moderation_client
+from telegram_notifier import notification_queue, close_bot
+from punishment_handler import punishment_store, import_legacy_punishments
+from event_journal import event_journal
+from verdict_batcher import verdict_batcher
+from checkpoint import restore_checkpoint, save_checkpoint, run_checkpointer
+from pre_classifier import pre_classifier
+from supervisor import Supervisor
+from text_registry import text_registry
+from metrics import serve_metrics, METRICS_PORT
+
+# Отслеживаемые серверы: [{"name": ..., "log_path": ...}]
+SERVERS = getattr(config, 'SERVERS', [
+    {"name": "HiTech", "log_path": r'C:\Users\rootu\cubixworld\updates\HiTech\logs\fml-client-latest.log'},
+    {"name": "Mobile", "log_path": r'C:\Users\rootu\cubixworld\updates\HiTech-Mobile\logs\fml-client-latest.log'},
+])
+
+# Число процессов для чтения логов; 0 - все логи читаются в основном процессе
+WORKER_PROCESSES = getattr(config, 'WORKER_PROCESSES', 0)
+
+# Сколько секунд после SIGINT/SIGTERM даётся на обработку очередей и отправку уведомлений.
+# Последние TELEGRAM_SHUTDOWN_RESERVE секунд из них оставляются на отправку в Telegram
+SHUTDOWN_TIMEOUT = getattr(config, 'SHUTDOWN_TIMEOUT', 20)
+TELEGRAM_SHUTDOWN_RESERVE = getattr(config, 'TELEGRAM_SHUTDOWN_RESERVE', 5)
+
+
+def install_signal_handlers(stop_event):
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop_event.set)
+        except NotImplementedError:
+            # Windows: обработчик вызывается в основном потоке, событие выставляется через loop
+            signal.signal(signal_number, lambda *_: loop.call_soon_threadsafe(stop_event.set))
+
+
+def remove_signal_handlers():
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.remove_signal_handler(signal_number)
+        except NotImplementedError:
+            signal.signal(signal_number, signal.default_int_handler if signal_number == signal.SIGINT else signal.SIG_DFL)
+
+
+# Ожидание сигнала остановки; упавшие задачи записываются в лог, остальные продолжают работать
+async def wait_for_stop(stop_event, tasks):
+    running = set(tasks)
+    while not stop_event.is_set() and running:
+        done, running = await asyncio.wait(running, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                logging.error(f"Задача {task.get_name()} завершилась с ошибкой: {task.exception()!r}")
+
+
+async def cancel_tasks(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def shutdown(supervisor, monitors, services):
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+
+    def remaining(reserve=0.0):
+        return max(0.1, deadline - time.monotonic() - reserve)
+
+    # 1. Прекращаем чтение логов: дальше обрабатывается только то, что уже прочитано
+    if supervisor:
+        await supervisor.stop()
+    await cancel_tasks(monitors)
+
+    # 2. Дообрабатываем очереди серверов; необработанное после срока будет прочитано заново при запуске
+    verdict_batcher.flush_all()
+    await asyncio.gather(*(queue.stop(timeout=remaining(TELEGRAM_SHUTDOWN_RESERVE))
+                           for queue in message_queues.values()))
+    message_queues.clear()
+
+    # 3. Отправляем накопившиеся уведомления
+    await notification_queue.stop(timeout=remaining())
+    await cancel_tasks(services)
+
+    # 4. Закрываем соединения и сохраняем состояние
+    await moderation_client.close()
+    await close_bot()
+    save_checkpoint()
+    punishment_store.close()
+    event_journal.close()
+    logging.info(f"Бот остановлен за {SHUTDOWN_TIMEOUT - (deadline - time.monotonic()):.1f} с")
+
+
+async def main():
+    stop_event = asyncio.Event()
+    install_signal_handlers(stop_event)
+
+    # Состояние восстанавливается до начала чтения логов: позиции, контекст игроков, кэш вердиктов
+    restore_checkpoint()
+    import_legacy_punishments()
+    pre_classifier.load()
+
+    services = [asyncio.create_task(coroutine, name=name) for name, coroutine in (
+        ("queue-stats", report_queue_stats()),
+        ("punishment-flusher", punishment_store.run_flusher()),
+        ("journal-flusher", event_journal.run_flusher()),
+        ("text-registry", text_registry.watch()),
+        ("checkpointer", run_checkpointer()),
+        ("tail-offsets", tail_offsets.run_saver()),
+        *([("metrics", serve_metrics())] if METRICS_PORT else [])
+    )]
+
+    supervisor = Supervisor(SERVERS, WORKER_PROCESSES) if WORKER_PROCESSES > 0 else None
+    if supervisor:
+        # Чтение и разбор логов в отдельных процессах, модерация - здесь
+        monitors = [asyncio.create_task(supervisor.run(), name="supervisor")]
+    else:
+        # Запускаем мониторы логов параллельно
+        monitors = [asyncio.create_task(monitor_log(server["log_path"], server["name"]), name=server["name"])
+                    for server in SERVERS]
+    logging.info(f"Бот запущен, серверов: {len(SERVERS)}")
+
+    try:
+        await wait_for_stop(stop_event, monitors + services)
+        logging.info("Получен сигнал остановки, завершаем обработку")
+    finally:
+        # Повторный Ctrl+C во время остановки прерывает её
+        remove_signal_handlers()
+        await shutdown(supervisor, monitors, services)
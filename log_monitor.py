@@ -1,90 +1,194 @@
 import os
-import re
+import time
 import asyncio
 import logging
-from data_loader import load_data
-from telegram_notifier import send_telegram_notification, send_telegram_alert
-from ai_request import generate_response
+import config
+import metrics
+from chat_parser import parse_line, LogClock
+from log_tailer import LogTailer, TailOffsetStore, OffsetCommitter
+from work_queue import MessageQueue
+from player_context import PlayerContextStore
+from flood_detector import flood_detector
+from event_journal import event_journal
+from text_normalizer import normalize, simplify
+from text_registry import text_registry
+from telegram_notifier import send_telegram_notification, send_telegram_alert, send_telegram_flood_alert
+from ai_request import get_prompt_version
+from pre_classifier import pre_classifier
+from verdict_batcher import verdict_batcher
+from verdict import format_minutes
+from verdict_cache import verdict_cache
 from punishment_handler import add_punishment, get_player_context
 
 # Хранение последних сообщений для контекста
-recent_messages = {}
-
-# Настройки логирования
-LOG_FILE = "bot.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler()]
-)
-
-# Загрузка данных из файлов
-keywords = load_data('texts/banned_words.txt')  # Ключевые слова для нарушений
-notification_keywords = load_data('texts/notification_keywords.txt')  # Ключевые слова для уведомлений
-whitelist = load_data('texts/whitelist.txt')  # Слова, которые не будут уведомляться
-trade_chat_phrases = load_data('texts/trade_chat.txt')  # Слова, которые разрешены только в торговом чате
-
-
-# Асинхронная функция для непрерывного чтения лог-файла
-async def follow(file):
-    file.seek(0, os.SEEK_END)
-    while True:
-        line = file.readline()
-        if not line:
-            await asyncio.sleep(0.1)
-            continue
-        yield line
+recent_messages = PlayerContextStore()
+
+# Позиции чтения лог-файлов: только полностью обработанные строки.
+# Файл позиций подключается при восстановлении состояния (checkpoint.restore_checkpoint)
+tail_offsets = TailOffsetStore(filename=None)
+
+# Очереди сообщений по серверам (тип лога -> MessageQueue)
+message_queues = {}
+
+# Время строк лога по серверам (тип лога -> LogClock)
+log_clocks = {}
+
+# Под каким именем модератора записываются наказания, предложенные нейросетью
+NEURAL_NETWORK_MODERATOR = getattr(config, 'NEURAL_NETWORK_MODERATOR', 'Нейросеть')
+
+
+# Проверка сообщения нейросетью с учётом кэша вердиктов и предварительной проверки.
+# Возвращает вердикт и его источник: cache, pre_classifier или llm
+async def check_with_neural_network(message, chat_type, normalized):
+    prompt_version = get_prompt_version(chat_type)
+    # Ключ кэша - сообщение после лёгкой нормализации, а не после normalize:
+    # транслит и знаки препинания меняют смысл сообщения для нейросети
+    cache_key = simplify(message)
+    verdict = verdict_cache.get(chat_type, prompt_version, cache_key)
+    if verdict is not None:
+        logging.info(f"Вердикт взят из кэша: {verdict.describe()}")
+        return verdict, 'cache'
 
+    # Очевидно чистые и очевидно нарушающие сообщения решаются локальной моделью
+    verdict = pre_classifier.verdict(normalized, chat_type)
+    if verdict is not None:
+        logging.info(f"Вердикт предварительной проверки: {verdict.describe()}")
+        return verdict, 'pre_classifier'
 
-# Функция для обработки сообщения
-async def process_message(channel, player_name, message, log_type):
+    verdict = await verdict_batcher.classify(message, chat_type)
+    if not verdict.error:
+        verdict_cache.put(chat_type, prompt_version, cache_key, verdict)
+    return verdict, 'llm'
+
+
+# Функция для обработки сообщения. Возвращает путь проверки и вердикт нейросети (если был).
+# log_time - время строки по логу (LogClock), по нему считаются окна детектора флуда
+async def process_message(channel, player_name, message, log_type, use_neural_network=True, log_time=None):
     lower_message = message.lower()
+    if player_name != "System":
+        update_player_messages(player_name, message)
 
     # Игнорируем все сообщения из "Общего" чата
     if channel.lower() == 'общий':
         if player_name != "System":
             logging.info(f"({log_type} Общий) {player_name}: {lower_message}")
-        return
+        return 'general', None
+
+    # Списки слов берутся из памяти; при изменении файлов реестр подменяет их целиком
+    texts = text_registry.snapshot
+    # Нормализуем один раз: результат нужен поиску слов, детектору флуда и предварительной проверке
+    normalized = normalize(message)
 
     # Проверка на наличие в белом списке
-    if any(whitelist_word in lower_message for whitelist_word in whitelist):
+    if texts.whitelist_matcher.search(lower_message):
+        metrics.keyword_hits.inc(list='whitelist')
         logging.info(f"Сообщение от {player_name} в канале {channel} находится в белом списке. Уведомление не отправлено.")
-        return
+        return 'whitelist', None
+
+    matches = texts.keyword_matcher.search(normalized)
+    path = None
 
     # Проверка на ключевые слова для уведомлений
-    for notify_keyword in notification_keywords:
-        if notify_keyword in lower_message:
-            logging.info(f"Оповещение от {player_name}: {notify_keyword}")
-            await send_telegram_alert(channel, player_name, message)
-            return  # Останавливаем обработку после отправки уведомления
+    if 'notification' in matches:
+        metrics.keyword_hits.inc(list='notification')
+        logging.info(f"Оповещение от {player_name}: {matches['notification'][0]}")
+        await send_telegram_alert(channel, player_name, message)
+        path = 'alert'  # Нейросеть после уведомления не нужна
 
     # Проверка на ключевые слова для нарушений
-    if any(keyword in lower_message for keyword in keywords):
+    elif 'banned' in matches:
+        metrics.keyword_hits.inc(list='banned')
         logging.info(f"Сообщение с ключевым словом: {message}")
         await send_telegram_notification(channel, player_name, message, "Нарушение по ключевому слову")
-        return
+        path = 'keyword'
+
+    # Флуд одного игрока или одинаковые сообщения от нескольких: одно уведомление на волну.
+    # Проверяется после списков слов, чтобы флуд не скрывал оповещения и нарушения
+    flood = flood_detector.check(player_name, normalized, log_type, log_time) if player_name != "System" else None
+    if flood is not None and flood.alert:
+        logging.info(f"Флуд от {player_name} в канале {channel}: {flood.description}")
+        await send_telegram_flood_alert(channel, player_name, message, flood.description)
+    if path is not None:
+        return path, None
+
+    # Пока игрок флудит, его сообщения не проверяются нейросетью и не дают отдельных уведомлений.
+    # Сообщения волны от разных игроков проверяются как обычно
+    if flood is not None and flood.kind != 'raid':
+        metrics.flood_suppressed.inc(kind=flood.kind)
+        if not flood.alert:
+            logging.info(f"Сообщение от {player_name} пропущено: {flood.description}")
+        return 'flood', None
 
     # Проверка через нейросеть только для глобального и торгового чатов
+    if not use_neural_network:
+        logging.info(f"Очередь переполнена, сообщение от {player_name} проверено только по ключевым словам.")
+        return 'keywords_only', None
     if channel.lower() in ['глобальный', 'торговый']:
         logging.info(f"Отправляем запрос к нейросети для {player_name}.")
-        rule_violation = await generate_response(message, channel.lower())  # Передаем тип чата
-        if "нарушение" in rule_violation.lower() or "мут" in rule_violation.lower():
-            logging.info(f"Нарушение обнаружено: {rule_violation}")
-            await send_telegram_notification(channel, player_name, message, rule_violation)
+        verdict, source = await check_with_neural_network(message, channel.lower(), normalized)  # Передаем тип чата
+        if verdict.error:
+            logging.error(f"Сообщение от {player_name} не проверено: {verdict.error}")
+        elif verdict.violation:
+            logging.info(f"Нарушение обнаружено: {verdict.describe()}")
+            if verdict.rule:
+                # Предложенное нейросетью наказание попадает в историю игрока
+                duration = format_minutes(verdict.duration) if verdict.duration else None
+                add_punishment(player_name, NEURAL_NETWORK_MODERATOR, verdict.rule, duration,
+                               get_player_context(player_name, recent_messages))
+            await send_telegram_notification(channel, player_name, message, verdict.describe())
         else:
             logging.info(f"Сообщение от {player_name}: нарушений не обнаружено.")
+        return source, verdict
+    return 'unchecked', None
+
+
+# Обработчики очереди сообщений: каждое сообщение с путём проверки и временем попадает в журнал событий
+async def process_chat_line(chat_line, use_neural_network=True):
+    start = time.perf_counter()
+    clock = log_clocks.get(chat_line.server)
+    if clock is None:
+        clock = log_clocks[chat_line.server] = LogClock()
+    path, verdict = await process_message(chat_line.channel, chat_line.player, chat_line.message, chat_line.server,
+                                          use_neural_network, clock.seconds(chat_line.timestamp))
+    event_journal.record(chat_line, path, verdict, time.perf_counter() - start)
+
+
+async def process_chat_line_keywords_only(chat_line):
+    await process_chat_line(chat_line, use_neural_network=False)
+
+
+# Очередь сообщений сервера с запущенными обработчиками. committer сдвигает позицию чтения лога
+# после обработки сообщений; выброшенные при переполнении сообщения тоже попадают в журнал
+def create_message_queue(log_type, committer=None):
+    def on_done(chat_line, dropped):
+        if dropped:
+            event_journal.record(chat_line, 'dropped')
+        if committer is not None:
+            committer.release(chat_line)
 
+    queue = MessageQueue(log_type, process_chat_line, degraded_handler=process_chat_line_keywords_only,
+                         on_done=on_done)
+    queue.start()
+    return queue
+
+
+# Периодический вывод состояния очередей в лог
+async def report_queue_stats(interval=60):
+    while True:
+        await asyncio.sleep(interval)
+        for name, queue in message_queues.items():
+            stats = queue.stats()
+            logging.info(
+                f"Очередь {name}: в ожидании {stats['depth']}, обрабатывается {stats['active']}, "
+                f"обработано {stats['processed']}, выброшено {stats['dropped']}, "
+                f"без нейросети {stats['degraded']}, ошибок {stats['failed']}, "
+                f"ожидание ср. {stats['avg_wait']:.2f} с / макс. {stats['max_wait']:.2f} с")
 
 
 # Функция для обновления списка сообщений игрока
 def update_player_messages(player_name, message):
-    if player_name not in recent_messages:
-        recent_messages[player_name] = []
-    recent_messages[player_name].append(message)
-
-    # Ограничиваем до 10 сообщений
-    if len(recent_messages[player_name]) > 10:
-        recent_messages[player_name] = recent_messages[player_name][-10:]
+    # Размер истории и число игроков ограничены самим хранилищем
+    recent_messages.add(player_name, message)
 
 
 # Основной цикл мониторинга лог-файла
@@ -95,16 +199,26 @@ async def monitor_log(log_path, log_type):
 
     logging.info(f"Начат мониторинг лог-файла: {log_path}")
 
-    with open(log_path, 'r', encoding='cp1251') as logfile:
-        async for line in follow(logfile):
-            chat_message_pattern = re.compile(
-                r'\[\d+:\d+:\d+\] \[.+?\] \[.+?\/\]: \[(?!System)(.+?)\] (.+?) -> .*? (.+)')
-            match = chat_message_pattern.search(line)
-
-            if match:
-                channel = match.group(1)
-                player_name = match.group(2)
-                message = match.group(3)
-
-                # Параллельно запускаем обработку каждого сообщения, передавая тип лога (HiTech или Mobile)
-                asyncio.create_task(process_message(channel, player_name, message, log_type))
+    # Позиция сохраняется, только когда обработаны все сообщения до неё
+    committer = OffsetCommitter(log_path, tail_offsets)
+    queue = message_queues[log_type] = create_message_queue(log_type, committer)
+
+    tailer = LogTailer(log_path, encoding='cp1251', offsets=tail_offsets)
+    metrics.tail_lag_bytes.set_function(lambda: tailer.lag()[0], server=log_type)
+    metrics.tail_lag_seconds.set_function(lambda: tailer.lag()[1], server=log_type)
+    try:
+        async for lines in tailer.follow_chunks():
+            for line in lines:
+                metrics.log_lines.inc(server=log_type)
+                chat_line = parse_line(line, log_type)
+
+                if chat_line is not None:
+                    metrics.chat_lines.inc(server=log_type, channel=chat_line.channel)
+                    committer.hold(chat_line)
+                    # Сообщения обрабатываются пулом обработчиков очереди сервера (HiTech или Mobile)
+                    queue.put(chat_line)
+            committer.seal(*tailer.position)
+    finally:
+        # Очередь не останавливается: при завершении main дообрабатывает её сам
+        metrics.tail_lag_bytes.remove(server=log_type)
+        metrics.tail_lag_seconds.remove(server=log_type)
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import errno
+import ctypes
+import ctypes.util
+import asyncio
+import logging
+from collections import deque
+import config
+
+# Размер блока чтения лог-файла (в байтах)
+TAIL_CHUNK_SIZE = getattr(config, 'TAIL_CHUNK_SIZE', 64 * 1024)
+
+# Интервал опроса файла, если inotify недоступен (в секундах)
+TAIL_POLL_INTERVAL = getattr(config, 'TAIL_POLL_INTERVAL', 0.1)
+
+# Даже с inotify периодически проверяем файл на ротацию на случай пропущенного события
+TAIL_CHECK_INTERVAL = getattr(config, 'TAIL_CHECK_INTERVAL', 2.0)
+
+# Файл с позициями чтения логов и как часто его сохранять (в секундах). После сбоя
+# заново обрабатывается не больше того, что было прочитано за этот интервал
+TAIL_OFFSETS_FILE = getattr(config, 'TAIL_OFFSETS_FILE', 'tail_offsets.json')
+TAIL_OFFSETS_SAVE_INTERVAL = getattr(config, 'TAIL_OFFSETS_SAVE_INTERVAL', 1.0)
+
+# Константы inotify из <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class TailOffsetStore:
+    """
+    Позиции чтения лог-файлов: {путь: {"inode": ..., "offset": ...}}.
+    Позволяет после перезапуска продолжить чтение с того же места.
+    """
+
+    def __init__(self, filename=TAIL_OFFSETS_FILE, save_interval=TAIL_OFFSETS_SAVE_INTERVAL):
+        self.filename = filename
+        self.save_interval = save_interval
+        self._offsets = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self.load()
+
+    def load(self):
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                self._offsets = json.load(f)
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке позиций лог-файлов: {e}")
+
+    def get(self, path):
+        return self._offsets.get(path)
+
+    def set(self, path, inode, offset):
+        self._offsets[path] = {"inode": inode, "offset": offset}
+        self._dirty = True
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    # Копия позиций и их восстановление (из файлов прежних версий)
+    def snapshot(self):
+        return {path: dict(position) for path, position in self._offsets.items()}
+
+    def restore(self, offsets):
+        self._offsets.update(offsets)
+        self._dirty = True
+
+    def save(self):
+        self._last_save = time.monotonic()
+        if not self.filename or not self._dirty:
+            return
+        try:
+            tmp_filename = self.filename + '.tmp'
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                json.dump(self._offsets, f, ensure_ascii=False)
+            os.replace(tmp_filename, self.filename)
+            self._dirty = False
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении позиций лог-файлов: {e}")
+
+    async def run_saver(self):
+        # set() сохраняет не чаще save_interval; последние позиции перед паузой в логе сохраняются здесь
+        while True:
+            await asyncio.sleep(self.save_interval)
+            self.save()
+
+
+class InotifyWatcher:
+    """Ожидание изменений в каталоге через inotify (только Linux)."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, "inotify_add_watch")
+
+        self._event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        # Сами события не разбираем: любое изменение в каталоге - повод перечитать файл
+        try:
+            while os.read(self._fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                logging.error(f"Ошибка чтения событий inotify: {e}")
+        self._event.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+    def close(self):
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Запасной вариант: просто ждём заданный интервал."""
+
+    def __init__(self, interval=TAIL_POLL_INTERVAL):
+        self.interval = interval
+
+    async def wait(self, timeout):
+        await asyncio.sleep(min(self.interval, timeout))
+
+    def close(self):
+        pass
+
+
+def create_watcher(directory):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except Exception as e:
+            logging.warning(f"inotify недоступен ({e}), используется опрос файла")
+    return PollingWatcher()
+
+
+class LogTailer:
+    """
+    Чтение дописываемого лог-файла большими блоками. Отслеживает усечение и
+    замену файла (ротацию) и сохраняет позицию чтения между перезапусками.
+    """
+
+    def __init__(self, path, encoding='utf-8', offsets=None, chunk_size=TAIL_CHUNK_SIZE):
+        self.path = path
+        self.encoding = encoding
+        self.offsets = offsets
+        self.chunk_size = chunk_size
+        self.offset = 0  # Позиция конца последней прочитанной полной строки
+        self._file = None
+        self._inode = None
+        self._pending = b''  # Неполная последняя строка
+        self._caught_up_at = time.time()  # Когда файл последний раз был дочитан до конца
+
+    def _open(self, start_from_saved):
+        self._file = open(self.path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._inode = stat.st_ino
+
+        saved = self.offsets.get(self.path) if self.offsets and start_from_saved else None
+        if not start_from_saved:
+            # Новый файл после ротации читаем с начала
+            self.offset = 0
+        elif saved is None:
+            # Первый запуск - начинаем с конца, как раньше
+            self.offset = stat.st_size
+        elif saved["inode"] == self._inode and saved["offset"] <= stat.st_size:
+            self.offset = saved["offset"]
+            logging.info(f"Продолжаем чтение {self.path} с позиции {self.offset}")
+        else:
+            # Пока бот не работал, файл был заменён - читаем новый целиком
+            self.offset = 0
+            logging.info(f"Лог-файл {self.path} был заменён, читаем его с начала")
+        self._file.seek(self.offset)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Проверка ротации и усечения. Возвращает True, если файл нужно переоткрыть
+    def _check_rotation(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if stat.st_ino != self._inode:
+            logging.info(f"Лог-файл {self.path} заменён (ротация), открываем заново")
+            return True
+        if stat.st_size < self.offset:
+            logging.info(f"Лог-файл {self.path} усечён, читаем с начала")
+            self.offset = 0
+            self._pending = b''
+            self._file.seek(0)
+        return False
+
+    # Чтение блока с полными строками. Неполная последняя строка остаётся в буфере
+    def _read_lines(self):
+        pending = self._pending
+        while True:
+            data = self._file.read(self.chunk_size)
+            if not data:
+                self._pending = pending
+                self._caught_up_at = time.time()
+                return []
+
+            pending += data
+            end = pending.rfind(b'\n')
+            if end >= 0:
+                break
+
+        complete, self._pending = pending[:end + 1], pending[end + 1:]
+        self.offset += len(complete)
+        return complete.decode(self.encoding, errors='replace').splitlines()
+
+    # Отставание чтения: (непрочитанных байт, возраст самых старых непрочитанных данных в секундах).
+    # Всё, что не прочитано, дописано после того, как файл последний раз был дочитан до конца,
+    # поэтому возраст считается от этого момента: пока чтение не успевает за записью, он растёт
+    def lag(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None, None
+        lag_bytes = max(0, stat.st_size - self.offset)
+        return lag_bytes, max(0.0, time.time() - self._caught_up_at) if lag_bytes else 0.0
+
+    # Файл и позиция конца последней прочитанной полной строки
+    @property
+    def position(self):
+        return self._inode, self.offset
+
+    async def follow_chunks(self):
+        """
+        Прочитанные строки блоками. После каждого блока position указывает на его конец;
+        после ротации отдаётся пустой блок с позицией в начале нового файла.
+        """
+        self._open(start_from_saved=True)
+        watcher = create_watcher(os.path.dirname(os.path.abspath(self.path)))
+        try:
+            while True:
+                lines = self._read_lines()
+                if lines:
+                    yield lines
+                    continue
+
+                await watcher.wait(TAIL_CHECK_INTERVAL)
+                if self._check_rotation():
+                    # Дочитываем остаток старого файла и переходим на новый
+                    while True:
+                        lines = self._read_lines()
+                        if not lines:
+                            break
+                        yield lines
+                    self._close()
+                    self._pending = b''
+                    self._open(start_from_saved=False)
+                    yield []
+        finally:
+            watcher.close()
+            self._close()
+            if self.offsets is not None:
+                self.offsets.save()
+
+
+class OffsetCommitter:
+    """
+    Сохраняет позицию чтения лога только после того, как обработаны все сообщения до неё.
+    Сообщения прочитанного блока удерживаются (hold), блок закрывается позицией его конца (seal),
+    обработанные сообщения отпускаются (release) в любом порядке. После перезапуска чтение
+    продолжается с конца последнего полностью обработанного блока: ничего не теряется,
+    и обработанное повторно не проверяется.
+    """
+
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+        self._chunks = deque()  # [inode, offset, сообщений в обработке], от старых к новым
+        self._open = None
+        self._held = {}  # сообщение -> блок
+
+    def hold(self, item):
+        if self._open is None:
+            self._open = [None, None, 0]
+            self._chunks.append(self._open)
+        self._open[2] += 1
+        self._held[item] = self._open
+
+    def seal(self, inode, offset):
+        if self._open is None:
+            self._chunks.append([inode, offset, 0])
+        else:
+            self._open[0], self._open[1] = inode, offset
+            self._open = None
+        self._advance()
+
+    def release(self, item):
+        chunk = self._held.pop(item, None)
+        if chunk is not None:
+            chunk[2] -= 1
+            if chunk[2] == 0:
+                self._advance()
+
+    def _advance(self):
+        committed = None
+        # Блок без позиции ещё не дочитан до конца
+        while self._chunks and self._chunks[0][2] == 0 and self._chunks[0][1] is not None:
+            committed = self._chunks.popleft()
+        if committed is not None:
+            self.offsets.set(self.path, committed[0], committed[1])
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+import logging
+from chat_parser import parse_line
+from logging_setup import setup_worker_logging
+from log_tailer import LogTailer, TailOffsetStore
+
+# Как часто отправлять накопленные сообщения чата и отчёт о состоянии (в секундах)
+SEND_INTERVAL = 0.05
+SEND_BATCH_SIZE = 256
+HEARTBEAT_INTERVAL = 5.0
+
+
+class ServerTail:
+    """Чтение лога одного сервера внутри рабочего процесса."""
+
+    def __init__(self, server, encoding, start_offsets):
+        self.name = server["name"]
+        self.log_path = server["log_path"]
+        # Позиции хранит основной процесс: он знает, что уже обработано, и передаёт их при запуске
+        offsets = TailOffsetStore(filename=None)
+        offsets.restore(start_offsets)
+        self.tailer = LogTailer(self.log_path, encoding=encoding, offsets=offsets)
+        self.position = None  # конец последнего блока, целиком попавшего в отправку
+        self.lines = 0
+        self.chat_lines = 0
+        self.last_line_at = None
+
+    def health(self):
+        lag_bytes, lag_seconds = self.tailer.lag()
+        return {
+            "lines": self.lines,
+            "chat_lines": self.chat_lines,
+            "lag_bytes": lag_bytes,
+            "lag_seconds": lag_seconds,
+            "last_line_at": self.last_line_at
+        }
+
+
+async def tail_server(server_tail, batch):
+    tailer = server_tail.tailer
+    async for lines in tailer.follow_chunks():
+        for line in lines:
+            server_tail.lines += 1
+            server_tail.last_line_at = time.time()
+            chat_line = parse_line(line, server_tail.name)
+            if chat_line is not None:
+                server_tail.chat_lines += 1
+                batch.append((chat_line.timestamp, chat_line.channel, chat_line.player, chat_line.message,
+                              chat_line.server))
+        server_tail.position = tailer.position
+
+
+# Отправка накопленных сообщений и позиций, до которых они прочитаны
+def send_batch(connection, batch, tails, sent_positions):
+    while batch:
+        connection.send(('lines', batch[:SEND_BATCH_SIZE]))
+        del batch[:SEND_BATCH_SIZE]
+    # Позиция двигается и без сообщений чата: остальные строки лога тоже прочитаны
+    positions = {server_tail.log_path: server_tail.position for server_tail in tails
+                 if server_tail.position is not None and sent_positions.get(server_tail.log_path) != server_tail.position}
+    if positions:
+        connection.send(('positions', positions))
+        sent_positions.update(positions)
+
+
+async def run_tails(servers, connection, stop_event, encoding, start_offsets):
+    batch = []
+    sent_positions = {}
+    tails = [ServerTail(server, encoding, start_offsets) for server in servers if os.path.exists(server["log_path"])]
+    for server in servers:
+        if not os.path.exists(server["log_path"]):
+            logging.error(f"Лог-файл не найден: {server['log_path']}")
+
+    tasks = [asyncio.create_task(tail_server(server_tail, batch)) for server_tail in tails]
+    last_heartbeat = 0.0
+    try:
+        while not stop_event.is_set():
+            await asyncio.sleep(SEND_INTERVAL)
+            if any(task.done() for task in tasks):
+                # Падение чтения одного из логов - повод перезапустить весь процесс
+                for task in tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()
+
+            send_batch(connection, batch, tails, sent_positions)
+
+            now = time.monotonic()
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                last_heartbeat = now
+                connection.send(('health', {server_tail.name: server_tail.health() for server_tail in tails}))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Отдаём то, что успели прочитать до остановки
+        if not connection.closed:
+            try:
+                send_batch(connection, batch, tails, sent_positions)
+            except OSError:
+                pass
+
+
+def run_worker(worker_id, servers, connection, stop_event, encoding='cp1251', start_offsets=None, log_queue=None):
+    """
+    Точка входа рабочего процесса: читает и разбирает логи своих серверов и отправляет
+    сообщения чата в основной процесс пачками через connection, а после них - позиции,
+    до которых логи прочитаны. start_offsets - {путь: {"inode": ..., "offset": ...}}, откуда начать.
+    Записи лога уходят через log_queue в основной процесс и попадают в bot.log.
+    """
+    if log_queue is not None:
+        setup_worker_logging(log_queue, f"[worker {worker_id}]")
+    else:
+        logging.basicConfig(level=logging.INFO,
+                            format=f"%(asctime)s [%(levelname)s] [worker {worker_id}] %(message)s", force=True)
+    logging.info(f"Рабочий процесс запущен, серверы: {', '.join(server['name'] for server in servers)}")
+    try:
+        asyncio.run(run_tails(servers, connection, stop_event, encoding, start_offsets or {}))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
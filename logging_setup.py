@@ -0,0 +1,52 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FILE = "bot.log"
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+
+def setup_logging(log_file, level=logging.INFO):
+    """
+    Логирование через очередь: обработчики событий только кладут запись в очередь,
+    а запись в файл и консоль выполняет отдельный поток QueueListener.
+    Как и logging.basicConfig, ничего не делает, если логирование уже настроено,
+    поэтому вызывается до импорта модулей, которые пишут в лог при загрузке.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(log_file, encoding='utf-8'), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    # При выходе дописываем всё, что осталось в очереди
+    atexit.register(listener.stop)
+    return listener
+
+
+def setup_worker_logging(log_queue, prefix, level=logging.INFO):
+    """
+    Логирование в дочернем процессе: записи с префиксом процесса уходят в log_queue,
+    а в файл и консоль их пишет основной процесс (forward_worker_logs).
+    """
+    handler = QueueHandler(log_queue)
+    # QueueHandler подставляет в запись уже отформатированное сообщение, время и уровень добавит основной процесс
+    handler.setFormatter(logging.Formatter(f"{prefix} %(message)s"))
+    # force=True: обработчики, унаследованные от импортированных модулей, заменяются своими
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+
+
+def forward_worker_logs(log_queue):
+    """Передаёт записи дочерних процессов из log_queue корневому логгеру основного процесса."""
+    listener = QueueListener(log_queue, logging.getLogger())
+    listener.start()
+    return listener
@@ -1,16 +1,12 @@
 import asyncio
-from log_monitor import monitor_log
-
-async def main():
-    # Запускаем два монитора логов параллельно
-    await asyncio.gather(
-        monitor_log(r'C:\Users\rootu\cubixworld\updates\HiTech\logs\fml-client-latest.log', 'HiTech'),
-        monitor_log(r'C:\Users\rootu\cubixworld\updates\HiTech-Mobile\logs\fml-client-latest.log', 'Mobile')
-    )
+from logging_setup import setup_logging, LOG_FILE
 
 if __name__ == '__main__':
-    try:
-        loop = asyncio.get_event_loop()  # Используем существующий event loop
-        loop.run_until_complete(main())
-    finally:
-        loop.close()  # Закрываем loop
+    # Логирование настраивается до импорта конвейера: модули пишут в лог уже при загрузке.
+    # Запись на диск идёт в отдельном потоке, чтобы не блокировать event loop
+    setup_logging(LOG_FILE)
+    # Процессы чтения логов запускаются через spawn и заново импортируют main.py,
+    # поэтому конвейер модерации (база наказаний, модели, списки слов)
+    # импортируется только здесь, а не при загрузке модуля
+    from lifecycle import main
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+import config
+
+# Адрес HTTP-эндпоинта /metrics (METRICS_PORT = None - не запускать)
+METRICS_HOST = getattr(config, 'METRICS_HOST', '127.0.0.1')
+METRICS_PORT = getattr(config, 'METRICS_PORT', 9108)
+
+# Границы корзин гистограмм задержек (в секундах)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик."""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение: задаётся явно или вычисляется функцией при каждом запросе /metrics."""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        self._functions[self._key(labels)] = function
+
+    def remove(self, **labels):
+        key = self._key(labels)
+        self._values.pop(key, None)
+        self._functions.pop(key, None)
+
+    def samples(self):
+        yield from super().samples()
+        for key, function in list(self._functions.items()):
+            try:
+                value = function()
+            except Exception as e:
+                logging.error(f"Ошибка при вычислении метрики {self.name}: {e}")
+                continue
+            if value is not None:
+                yield self.name, key, value
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам (задержки)."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # корзины, сумма, количество
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    # Замер времени выполнения блока: with histogram.time(server="HiTech"): ...
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        labelnames = self.labelnames + ('le',)
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(labelnames, key + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Чтение логов
+log_lines = Counter('cubix_log_lines_total', 'Прочитано строк лог-файла', ['server'])
+chat_lines = Counter('cubix_chat_lines_total', 'Разобрано сообщений чата', ['server', 'channel'])
+tail_lag_bytes = Gauge('cubix_tail_lag_bytes', 'Непрочитанный остаток лог-файла в байтах', ['server'])
+tail_lag_seconds = Gauge('cubix_tail_lag_seconds', 'Возраст самых старых непрочитанных данных лог-файла в секундах', ['server'])
+
+# Проверка сообщений
+keyword_hits = Counter('cubix_keyword_hits_total', 'Срабатывания списков слов', ['list'])
+verdict_cache_requests = Counter('cubix_verdict_cache_requests_total', 'Обращения к кэшу вердиктов', ['result'])
+verdict_cache_size = Gauge('cubix_verdict_cache_size', 'Записей в кэше вердиктов')
+flood_events = Counter('cubix_flood_events_total', 'Начавшиеся волны флуда', ['kind'])
+flood_suppressed = Counter('cubix_flood_suppressed_total', 'Сообщения флуда, пропущенные без проверки', ['kind'])
+preclassifier_decisions = Counter('cubix_preclassifier_decisions_total',
+                                  'Решения предварительной проверки перед нейросетью', ['decision'])
+
+# Нейросеть
+llm_requests = Counter('cubix_llm_requests_total', 'Запросы к нейросети', ['status'])
+llm_latency = Histogram('cubix_llm_request_seconds', 'Время ответа нейросети')
+llm_early_exits = Counter('cubix_llm_early_exits_total', 'Потоковые ответы, прерванные после получения вердикта')
+
+# Очереди сообщений
+queue_depth = Gauge('cubix_queue_depth', 'Сообщений в очереди сервера', ['server'])
+queue_wait = Histogram('cubix_queue_wait_seconds', 'Время ожидания сообщения в очереди', ['server'])
+queue_dropped = Counter('cubix_queue_dropped_total', 'Сообщения, выброшенные или упрощённые при переполнении',
+                        ['server', 'action'])
+
+# Telegram
+telegram_send_latency = Histogram('cubix_telegram_send_seconds', 'Время отправки сообщения в Telegram')
+telegram_sends = Counter('cubix_telegram_sends_total', 'Отправки сообщений в Telegram', ['status'])
+telegram_backlog = Gauge('cubix_telegram_backlog', 'Уведомлений в очереди на отправку')
+
+
+async def serve_metrics(host=METRICS_HOST, port=METRICS_PORT):
+    """HTTP-эндпоинт /metrics в текстовом формате Prometheus."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
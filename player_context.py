@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+import config
+
+# Сколько последних сообщений хранить на игрока
+CONTEXT_MESSAGES_PER_PLAYER = getattr(config, 'CONTEXT_MESSAGES_PER_PLAYER', 10)
+
+# Максимальное число игроков в памяти и через сколько секунд молчания игрок забывается
+CONTEXT_MAX_PLAYERS = getattr(config, 'CONTEXT_MAX_PLAYERS', 5000)
+CONTEXT_IDLE_TTL = getattr(config, 'CONTEXT_IDLE_TTL', 60 * 60)
+
+
+class PlayerContextStore:
+    """
+    Последние сообщения игроков: кольцевой буфер фиксированного размера на игрока.
+    Игроки упорядочены по последней активности; давно молчащие и лишние сверх
+    CONTEXT_MAX_PLAYERS удаляются целиком, так что память ограничена
+    max_players * max_messages сообщений.
+    """
+
+    def __init__(self, max_messages=CONTEXT_MESSAGES_PER_PLAYER, max_players=CONTEXT_MAX_PLAYERS,
+                 idle_ttl=CONTEXT_IDLE_TTL):
+        self.max_messages = max_messages
+        self.max_players = max_players
+        self.idle_ttl = idle_ttl
+        self._players = OrderedDict()  # игрок -> deque[(время, сообщение)], от давно молчавших к активным
+
+    def __contains__(self, player_name):
+        return player_name in self._players
+
+    def __len__(self):
+        return len(self._players)
+
+    def add(self, player_name, message, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        messages = self._players.get(player_name)
+        if messages is None:
+            messages = self._players[player_name] = deque(maxlen=self.max_messages)
+        else:
+            self._players.move_to_end(player_name)
+        messages.append((timestamp, message))
+        self._evict(timestamp)
+
+    def _evict(self, now):
+        players = self._players
+        while len(players) > self.max_players:
+            players.popitem(last=False)
+        # Самый давно активный игрок всегда первый, поэтому проверка дешёвая
+        while players:
+            oldest = next(iter(players.values()))
+            if oldest[-1][0] >= now - self.idle_ttl:
+                break
+            players.popitem(last=False)
+
+    def last(self, player_name, count=None):
+        """Последние count сообщений игрока (все сохранённые, если count не задан), от старых к новым."""
+        messages = self._players.get(player_name)
+        if not messages:
+            return []
+        if count is None or count >= len(messages):
+            return [message for _, message in messages]
+        return [message for _, message in islice(messages, len(messages) - count, None)]
+
+    def since(self, player_name, seconds, now=None):
+        """Сообщения игрока за последние seconds секунд, от старых к новым."""
+        messages = self._players.get(player_name)
+        if not messages:
+            return []
+        border = (time.time() if now is None else now) - seconds
+        recent = []
+        for timestamp, message in reversed(messages):
+            if timestamp < border:
+                break
+            recent.append(message)
+        recent.reverse()
+        return recent
+
+    def snapshot(self):
+        """Все сообщения для контрольной точки: [[игрок, [[время, сообщение], ...]], ...] от давно молчавших к активным."""
+        return [[player_name, [list(entry) for entry in messages]] for player_name, messages in self._players.items()]
+
+    def restore(self, players, now=None):
+        now = time.time() if now is None else now
+        for player_name, messages in players:
+            for timestamp, message in messages[-self.max_messages:]:
+                self.add(player_name, message, timestamp)
+        # Пока бот не работал, часть игроков могла замолчать слишком давно
+        self._evict(now)
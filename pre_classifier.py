@@ -0,0 +1,351 @@
+"""
+Быстрая локальная предварительная оценка сообщений перед нейросетью.
+
+Признаки - символьные n-граммы нормализованного текста, хэшированные в фиксированное
+пространство, отдельно общие и в паре с типом чата: промпты глобального и торгового
+чатов размечают одни и те же сообщения по-разному. Модель - логистическая регрессия. Сообщения с уверенной оценкой решаются
+на месте, в нейросеть уходят только попавшие в "неуверенную" полосу между порогами.
+
+Обучение и оценка (из корня репозитория):
+    python pre_classifier.py train --cache checkpoint.json.gz --db punishments.db --data extra.jsonl
+    python pre_classifier.py eval --cache verdict_cache.json --low 0.05 --high 0.98
+"""
+import os
+import sys
+import gzip
+import json
+import math
+import zlib
+import random
+import logging
+import argparse
+import config
+import metrics
+from text_normalizer import normalize
+from verdict import Verdict
+
+# Файл модели (None - не использовать) и пороги: ниже LOW - нарушений нет,
+# выше HIGH - нарушение, между ними решает нейросеть
+PRECLASSIFIER_MODEL = getattr(config, 'PRECLASSIFIER_MODEL', 'pre_classifier.json')
+PRECLASSIFIER_LOW = getattr(config, 'PRECLASSIFIER_LOW', 0.05)
+PRECLASSIFIER_HIGH = getattr(config, 'PRECLASSIFIER_HIGH', 0.98)
+
+NGRAM_RANGE = (2, 4)
+HASH_BITS = 18
+MODEL_VERSION = 2
+
+# Чаты, которые проверяет нейросеть. Примеры без типа чата (наказания модераторов)
+# используются при обучении для каждого из них
+CHAT_TYPES = ('глобальный', 'торговый')
+
+
+def extract_features(normalized, chat_type, ngram_range=NGRAM_RANGE, hash_bits=HASH_BITS):
+    """
+    Номера хэшированных признаков сообщения (с повторами): тип чата, каждая символьная
+    n-грамма и она же в паре с типом чата. normalized - сообщение после text_normalizer.normalize.
+    """
+    text = f" {normalized} ".encode('utf-8')
+    mask = (1 << hash_bits) - 1
+    # crc32 не зависит от PYTHONHASHSEED, поэтому модель переносима между запусками;
+    # crc32 пары считается продолжением crc32 типа чата
+    chat_crc = zlib.crc32(f"{chat_type}\x00".encode('utf-8'))
+    features = [chat_crc & mask]
+    for size in range(ngram_range[0], ngram_range[1] + 1):
+        for start in range(len(text) - size + 1):
+            ngram = text[start:start + size]
+            features.append(zlib.crc32(ngram) & mask)
+            features.append(zlib.crc32(ngram, chat_crc) & mask)
+    return features
+
+
+def _sigmoid(value):
+    if value < -30:
+        return 0.0
+    if value > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+class PreClassifier:
+    """
+    Логистическая регрессия по хэшированным n-граммам. score() - вероятность нарушения
+    в чате chat_type для сообщения, уже приведённого text_normalizer.normalize.
+    """
+
+    def __init__(self, weights=None, bias=0.0, ngram_range=NGRAM_RANGE, hash_bits=HASH_BITS):
+        self.weights = weights or {}
+        self.bias = bias
+        self.ngram_range = tuple(ngram_range)
+        self.hash_bits = hash_bits
+
+    def score(self, normalized, chat_type):
+        features = extract_features(normalized, chat_type, self.ngram_range, self.hash_bits)
+        weights = self.weights
+        scale = 1.0 / math.sqrt(len(features))
+        return _sigmoid(self.bias + scale * sum(weights.get(feature, 0.0) for feature in features))
+
+    def train(self, samples, epochs=8, learning_rate=0.5, l2=1e-6, seed=42):
+        """
+        Обучение AdaGrad-ом на [(сообщение, тип чата, 0/1)]. Классы взвешиваются,
+        потому что нарушений в чате намного меньше, чем обычных сообщений.
+        """
+        positives = sum(label for _, _, label in samples)
+        negatives = len(samples) - positives
+        if not positives or not negatives:
+            raise ValueError("Для обучения нужны примеры и с нарушениями, и без")
+        class_weight = {1: len(samples) / (2 * positives), 0: len(samples) / (2 * negatives)}
+
+        featurized = [(extract_features(normalize(message), chat_type, self.ngram_range, self.hash_bits), label)
+                      for message, chat_type, label in samples]
+        squared_gradients = {}
+        bias_squared_gradient = 1e-8
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(featurized)
+            for features, label in featurized:
+                scale = 1.0 / math.sqrt(len(features))
+                prediction = _sigmoid(self.bias + scale * sum(self.weights.get(f, 0.0) for f in features))
+                gradient = (prediction - label) * class_weight[label]
+
+                for feature in features:
+                    weight = self.weights.get(feature, 0.0)
+                    feature_gradient = gradient * scale + l2 * weight
+                    squared = squared_gradients.get(feature, 1e-8) + feature_gradient ** 2
+                    squared_gradients[feature] = squared
+                    self.weights[feature] = weight - learning_rate * feature_gradient / math.sqrt(squared)
+
+                bias_squared_gradient += gradient ** 2
+                self.bias -= learning_rate * gradient / math.sqrt(bias_squared_gradient)
+
+        # Почти нулевые веса не влияют на оценку, но раздувают файл модели
+        self.weights = {feature: weight for feature, weight in self.weights.items() if abs(weight) > 1e-4}
+
+    def save(self, filename):
+        model = {
+            "version": MODEL_VERSION,
+            "ngram_range": list(self.ngram_range),
+            "hash_bits": self.hash_bits,
+            "bias": self.bias,
+            "weights": {str(feature): round(weight, 6) for feature, weight in self.weights.items()}
+        }
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(model, f)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            model = json.load(f)
+        if model.get("version") != MODEL_VERSION:
+            raise ValueError("модель обучена без учёта типа чата, её нужно обучить заново")
+        weights = {int(feature): weight for feature, weight in model["weights"].items()}
+        return cls(weights, model["bias"], model["ngram_range"], model["hash_bits"])
+
+
+def load_pre_classifier(filename):
+    """Модель из файла или None, если она ещё не обучена."""
+    if not filename or not os.path.exists(filename):
+        return None
+    try:
+        classifier = PreClassifier.load(filename)
+        logging.info(f"Загружена модель предварительной проверки {filename}: {len(classifier.weights)} весов")
+        return classifier
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке модели предварительной проверки {filename}: {e}")
+        return None
+
+
+class PreClassifierGate:
+    """
+    Решает по оценке модели, нужен ли запрос к нейросети.
+    verdict() возвращает готовый Verdict или None, если сообщение надо отправить нейросети.
+    Модель загружается при запуске бота (load()); без обученной модели пропускает всё.
+    """
+
+    def __init__(self, filename=PRECLASSIFIER_MODEL, low=PRECLASSIFIER_LOW, high=PRECLASSIFIER_HIGH):
+        self.filename = filename
+        self.classifier = None
+        self.low = low
+        self.high = high
+
+    def load(self):
+        self.classifier = load_pre_classifier(self.filename)
+
+    def verdict(self, normalized, chat_type):
+        if self.classifier is None:
+            return None
+        score = self.classifier.score(normalized, chat_type)
+        if score < self.low:
+            metrics.preclassifier_decisions.inc(decision='clean')
+            return Verdict(False, comment="предварительная проверка")
+        if score > self.high:
+            metrics.preclassifier_decisions.inc(decision='violation')
+            return Verdict(True, comment=f"предварительная проверка, оценка {score:.2f}")
+        metrics.preclassifier_decisions.inc(decision='escalated')
+        return None
+
+
+# === Наборы данных ===
+
+def samples_from_cache(filename):
+    """
+    Вердикты нейросети из снимка кэша вердиктов: [чат, версия промпта, сообщение, срок, вердикт].
+    Принимает и контрольную точку бота (checkpoint.json.gz) - вердикты берутся из неё.
+    """
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'rt', encoding='utf-8') as f:
+            entries = json.load(f)["verdicts"]
+    else:
+        with open(filename, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    return [(message, chat_type, int(verdict["violation"]))
+            for chat_type, _, message, _, verdict in entries if isinstance(verdict, dict)]
+
+
+def samples_from_punishments(filename):
+    """
+    Последние сообщения игроков перед наказанием - примеры нарушений.
+    Чат, в котором было сообщение, не сохраняется, поэтому тип чата не указан (None).
+    """
+    from punishment_store import PunishmentStore
+    store = PunishmentStore(filename)
+    try:
+        rows = store._query("SELECT context FROM punishments WHERE context IS NOT NULL")
+    finally:
+        store.close()
+    samples = []
+    for (context,) in rows:
+        messages = json.loads(context) if context else []
+        if messages:
+            samples.append((messages[-1], None, 1))
+    return samples
+
+
+def samples_from_jsonl(filename):
+    """
+    Размеченные вручную примеры: строки {"message": ..., "chat_type": ..., "violation": true/false}.
+    Без chat_type пример относится ко всем типам чата.
+    """
+    samples = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                samples.append((record["message"], record.get("chat_type"), int(bool(record["violation"]))))
+    return samples
+
+
+def load_samples(args):
+    samples = []
+    for filename in args.cache or []:
+        samples.extend(samples_from_cache(filename))
+    for filename in args.db or []:
+        samples.extend(samples_from_punishments(filename))
+    for filename in args.data or []:
+        samples.extend(samples_from_jsonl(filename))
+
+    # Примеры без типа чата - для каждого из проверяемых чатов
+    samples = [(message, chat_type, label) for message, sample_chat_type, label in samples
+               for chat_type in ((sample_chat_type,) if sample_chat_type else CHAT_TYPES)]
+    # Одинаковые сообщения с одинаковой меткой не добавляют информации
+    return list(dict.fromkeys(samples))
+
+
+# === Оценка ===
+
+def evaluate(classifier, samples, low, high):
+    """
+    Сколько запросов к нейросети экономится при порогах low/high и какой ценой.
+    """
+    clean_total = clean_correct = violation_total = violation_correct = 0
+    missed_violations = 0
+    positives = sum(label for _, _, label in samples)
+    for message, chat_type, label in samples:
+        score = classifier.score(normalize(message), chat_type)
+        if score < low:
+            clean_total += 1
+            clean_correct += label == 0
+            missed_violations += label == 1
+        elif score > high:
+            violation_total += 1
+            violation_correct += label == 1
+
+    decided = clean_total + violation_total
+    return {
+        "samples": len(samples),
+        "llm_calls_saved": decided / len(samples) if samples else 0.0,
+        "clean_decided": clean_total,
+        "clean_precision": clean_correct / clean_total if clean_total else 1.0,
+        "violation_decided": violation_total,
+        "violation_precision": violation_correct / violation_total if violation_total else 1.0,
+        "missed_violations": missed_violations / positives if positives else 0.0
+    }
+
+
+def print_report(classifier, samples, low, high):
+    print(f"Примеров: {len(samples)}, из них нарушений: {sum(label for _, _, label in samples)}")
+    print(f"{'нижний':>7} {'верхний':>8} {'экономия':>9} {'точн. чистых':>13} {'точн. нарушений':>16} {'пропущено':>10}")
+    thresholds = sorted({(low, high), (0.02, 0.99), (0.05, 0.98), (0.1, 0.95), (0.2, 0.9)})
+    for current_low, current_high in thresholds:
+        report = evaluate(classifier, samples, current_low, current_high)
+        marker = " <- текущие" if (current_low, current_high) == (low, high) else ""
+        print(f"{current_low:>7.2f} {current_high:>8.2f} {report['llm_calls_saved']:>9.1%} "
+              f"{report['clean_precision']:>13.1%} {report['violation_precision']:>16.1%} "
+              f"{report['missed_violations']:>10.1%}{marker}")
+
+    # Промпты чатов размечают по-разному, поэтому качество смотрится и по каждому чату отдельно
+    print(f"По типам чата при порогах {low:.2f} / {high:.2f}:")
+    print(f"{'чат':>12} {'примеров':>9} {'экономия':>9} {'точн. чистых':>13} {'точн. нарушений':>16} {'пропущено':>10}")
+    for chat_type in sorted({chat_type for _, chat_type, _ in samples}):
+        chat_samples = [sample for sample in samples if sample[1] == chat_type]
+        report = evaluate(classifier, chat_samples, low, high)
+        print(f"{chat_type:>12} {len(chat_samples):>9} {report['llm_calls_saved']:>9.1%} "
+              f"{report['clean_precision']:>13.1%} {report['violation_precision']:>16.1%} "
+              f"{report['missed_violations']:>10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обучение и оценка предварительной проверки сообщений")
+    parser.add_argument('command', choices=('train', 'eval'))
+    parser.add_argument('--cache', action='append', help='Снимок кэша вердиктов (verdict_cache.json или checkpoint.json.gz)')
+    parser.add_argument('--db', action='append', help='База наказаний (punishments.db)')
+    parser.add_argument('--data', action='append', help='Размеченные примеры в JSONL')
+    parser.add_argument('--model', default=PRECLASSIFIER_MODEL)
+    parser.add_argument('--low', type=float, default=PRECLASSIFIER_LOW)
+    parser.add_argument('--high', type=float, default=PRECLASSIFIER_HIGH)
+    parser.add_argument('--holdout', type=float, default=0.2, help='Доля примеров для проверки при обучении')
+    parser.add_argument('--epochs', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    samples = load_samples(args)
+    if not samples:
+        sys.exit("Нет примеров: укажите --cache, --db или --data")
+
+    if args.command == 'eval':
+        print_report(PreClassifier.load(args.model), samples, args.low, args.high)
+        return
+
+    random.Random(args.seed).shuffle(samples)
+    split = int(len(samples) * (1 - args.holdout))
+    train_samples, test_samples = samples[:split], samples[split:]
+
+    classifier = PreClassifier()
+    classifier.train(train_samples, epochs=args.epochs, seed=args.seed)
+    if test_samples:
+        print("Проверка на отложенных примерах:")
+        print_report(classifier, test_samples, args.low, args.high)
+
+    # Итоговая модель обучается на всех примерах
+    classifier = PreClassifier()
+    classifier.train(samples, epochs=args.epochs, seed=args.seed)
+    classifier.save(args.model)
+    print(f"Модель сохранена в {args.model}: {len(classifier.weights)} весов")
+
+
+pre_classifier = PreClassifierGate()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,32 @@
 import logging
-import json
 import os
+import config
+from punishment_store import PunishmentStore
 
-PUNISHMENT_FILE = 'punishments.json'
+PUNISHMENT_FILE = 'punishments.json'  # Старый формат, только для импорта
+PUNISHMENT_DB = getattr(config, 'PUNISHMENT_DB', 'punishments.db')
 
-def load_punishments():
-    # Проверяем существование файла наказаний
-    if not os.path.exists(PUNISHMENT_FILE):
-        logging.warning(f"Файл {PUNISHMENT_FILE} не найден, создается новый.")
-        return {}
+punishment_store = PunishmentStore(PUNISHMENT_DB)
 
+def import_legacy_punishments():
+    # При первом запуске переносим историю из punishments.json; вызывается из main при старте
+    if not os.path.exists(PUNISHMENT_FILE) or not punishment_store.is_empty():
+        return
     try:
-        with open(PUNISHMENT_FILE, 'r', encoding='utf-8') as f:
-            # Если файл пустой, возвращаем пустой словарь
-            if os.stat(PUNISHMENT_FILE).st_size == 0:
-                logging.warning(f"Файл {PUNISHMENT_FILE} пуст, создание пустой структуры.")
-                return {}
-            return json.load(f)
-    except json.JSONDecodeError as e:
-        logging.error(f"Ошибка при чтении JSON: {e}")
-        return {}
-
-def save_punishments(punishments):
-    try:
-        with open(PUNISHMENT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(punishments, f, ensure_ascii=False, indent=4)
+        punishment_store.import_json(PUNISHMENT_FILE)
     except Exception as e:
-        logging.error(f"Ошибка при записи в файл наказаний: {e}")
+        logging.error(f"Ошибка при импорте {PUNISHMENT_FILE}: {e}")
 
 def add_punishment(player_name, moderator_name, reason_code, duration, context):
-    punishments = load_punishments()
-    punishment_data = {
-        "player": player_name,
-        "moderator": moderator_name,
-        "reason_code": reason_code,
-        "duration": duration,
-        "context": context
-    }
-    punishments[player_name] = punishment_data
-    save_punishments(punishments)
+    # Добавляет запись в историю, не перезаписывая предыдущие наказания игрока
+    punishment_store.add(player_name, moderator_name, reason_code, duration, context)
 
-def get_player_context(player_name, recent_messages):
-    # Получаем последние 10 сообщений игрока для контекста
+def get_player_context(player_name, recent_messages, limit=10, seconds=None):
+    # Последние limit сообщений игрока или все его сообщения за последние seconds секунд
     if player_name in recent_messages:
-        return recent_messages[player_name][-10:]
+        if seconds is not None:
+            return recent_messages.since(player_name, seconds)
+        return recent_messages.last(player_name, limit)
     else:
         logging.warning(f"Контекст для игрока {player_name} не найден.")
         return []
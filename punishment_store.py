@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+
+# Сколько наказаний копить в памяти перед записью в базу и как часто сбрасывать их (в секундах)
+WRITE_BATCH_SIZE = 50
+FLUSH_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punishments (
+    id INTEGER PRIMARY KEY,
+    player TEXT NOT NULL,
+    moderator TEXT,
+    reason_code TEXT,
+    duration TEXT,
+    context TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_punishments_player ON punishments (player, created_at);
+CREATE INDEX IF NOT EXISTS idx_punishments_moderator ON punishments (moderator, created_at);
+CREATE INDEX IF NOT EXISTS idx_punishments_reason ON punishments (reason_code, created_at);
+CREATE INDEX IF NOT EXISTS idx_punishments_time ON punishments (created_at);
+"""
+
+COLUMNS = ('id', 'player', 'moderator', 'reason_code', 'duration', 'context', 'created_at')
+
+
+class PunishmentStore:
+    """
+    История наказаний в SQLite (режим WAL). Каждое наказание - отдельная строка,
+    записи копятся в памяти и пишутся в базу пачками в отдельном потоке (run_flusher),
+    так что add() из event loop никогда не ждёт диска.
+    """
+
+    def __init__(self, filename, batch_size=WRITE_BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = batch_size
+        self._lock = threading.Lock()  # только для _pending, держится недолго
+        self._db_lock = threading.Lock()  # соединение с базой
+        self._pending = []
+        self._wakeup = None
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def add(self, player, moderator, reason_code, duration, context, created_at=None):
+        row = (player, moderator, reason_code, duration, json.dumps(context, ensure_ascii=False),
+               created_at if created_at is not None else time.time())
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        # Набралась пачка - будим поток записи, не дожидаясь интервала
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._db_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                rows, self._pending = self._pending, []
+            try:
+                with self._connection:
+                    self._connection.executemany(
+                        "INSERT INTO punishments (player, moderator, reason_code, duration, context, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                # Не теряем наказания: вернём их в очередь до следующей попытки
+                with self._lock:
+                    self._pending[:0] = rows
+                logging.error(f"Ошибка при записи наказаний в базу: {e}")
+
+    # Запись накопленных наказаний раз в interval секунд или сразу, как наберётся пачка, не блокируя event loop
+    async def run_flusher(self, interval=FLUSH_INTERVAL):
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await asyncio.to_thread(self.flush)
+        finally:
+            self._wakeup = None
+
+    def _query(self, sql, params=()):
+        self.flush()
+        with self._db_lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def _to_dict(self, row):
+        record = dict(zip(COLUMNS, row))
+        record['context'] = json.loads(record['context']) if record['context'] else []
+        return record
+
+    def is_empty(self):
+        return not self._query("SELECT 1 FROM punishments LIMIT 1")
+
+    def count(self, player=None, reason_code=None, moderator=None, since=None):
+        """
+        Количество наказаний по условиям, например сколько мутов 2.3 у игрока за неделю:
+        count(player="X", reason_code="2.3", since=time.time() - 7 * 24 * 3600)
+        """
+        conditions, params = [], []
+        for column, value in (('player', player), ('reason_code', reason_code), ('moderator', moderator)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._query(f"SELECT COUNT(*) FROM punishments{where}", params)[0][0]
+
+    def history(self, player, limit=None):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM punishments WHERE player = ? ORDER BY created_at DESC"
+        params = [player]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._to_dict(row) for row in self._query(sql, params)]
+
+    def import_json(self, json_filename):
+        """Однократный перенос наказаний из старого punishments.json."""
+        with open(json_filename, 'r', encoding='utf-8') as f:
+            punishments = json.load(f) if os.stat(json_filename).st_size else {}
+
+        # Время наказаний в старом файле не хранилось - используем время изменения файла
+        created_at = os.path.getmtime(json_filename)
+        for player_name, data in punishments.items():
+            self.add(data.get("player", player_name), data.get("moderator"), data.get("reason_code"),
+                     data.get("duration"), data.get("context", []), created_at)
+        self.flush()
+        logging.info(f"Импортировано {len(punishments)} наказаний из {json_filename} в {self.filename}")
+        return len(punishments)
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            self._connection.close()
+
+
+if __name__ == '__main__':
+    # python punishment_store.py import punishments.json punishments.db
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if len(sys.argv) != 4 or sys.argv[1] != 'import':
+        sys.exit("Использование: python punishment_store.py import <punishments.json> <punishments.db>")
+
+    store = PunishmentStore(sys.argv[3])
+    if not store.is_empty():
+        sys.exit(f"База {sys.argv[3]} уже содержит наказания, импорт отменён")
+    store.import_json(sys.argv[2])
+    store.close()
@@ -0,0 +1,329 @@
+"""
+Офлайн-прогон записанных логов клиента через весь конвейер модерации.
+
+Вместо нейросети поднимается локальный HTTP-сервер с настраиваемой задержкой,
+вместо Telegram - заглушка, запоминающая отправленные сообщения. В конце выводятся
+строк/с, перцентили задержек по этапам, число запросов к нейросети и пик памяти.
+
+Запуск из корня репозитория:
+    python replay.py logs/hitech.log logs/mobile.log --speed max --llm-latency 0.3
+"""
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import types
+import random
+import asyncio
+import logging
+import argparse
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Конфигурация для прогона: реальный config.py не обязателен, а файлы состояния бота не трогаем
+try:
+    import config
+except ImportError:
+    config = types.ModuleType('config')
+    config.SECRET_API_URL = ''
+    config.SECRET_API_TOKEN = 'replay'
+    config.TELEGRAM_TOKEN = '123456:replay'
+    config.CHAT_ID = 0
+    sys.modules['config'] = config
+config.VERDICT_CACHE_FILE = None
+config.PUNISHMENT_DB = ':memory:'
+config.JOURNAL_DIR = None
+
+from aiohttp import web
+
+timestamp_pattern = re.compile(r'^\[(\d+):(\d+):(\d+)\]')
+batch_line_pattern = re.compile(r'^\s*(\d+)\. ')
+
+
+class StageTimings:
+    """Задержки этапов конвейера в секундах."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def report(self):
+        lines = []
+        for stage, samples in self.samples.items():
+            samples.sort()
+            count = len(samples)
+
+            def percentile(p):
+                return samples[min(count - 1, int(count * p))] * 1000
+
+            lines.append(f"  {stage:<8} n={count:<7} p50={percentile(0.5):9.2f} мс  p90={percentile(0.9):9.2f} мс  "
+                         f"p99={percentile(0.99):9.2f} мс  max={samples[-1] * 1000:9.2f} мс")
+        return "\n".join(lines)
+
+
+class FakeLLMServer:
+    """
+    Локальная замена API нейросети с заданной задержкой и долей нарушений.
+    latency - время до первого фрагмента ответа, token_latency - пауза между фрагментами потока.
+    """
+
+    def __init__(self, latency, jitter, violation_rate, seed, token_latency=0.02):
+        self.latency = latency
+        self.jitter = jitter
+        self.violation_rate = violation_rate
+        self.seed = seed
+        self.token_latency = token_latency
+        self.calls = 0
+        self._runner = None
+
+    # Вердикт детерминирован для текста сообщения, как у настоящей модели с низкой температурой
+    def _verdict(self, message):
+        if random.Random(f"{self.seed}:{message}").random() < self.violation_rate:
+            return {"violation": True, "rule": "2.1", "duration": 10}
+        return {"violation": False}
+
+    async def _handle(self, request):
+        self.calls += 1
+        payload = await request.json()
+        user_message = payload["messages"][1]["content"]
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        lines = user_message.splitlines()
+        if len(lines) > 1 and all(batch_line_pattern.match(line) for line in lines):
+            content = "\n".join(json.dumps({"n": number, **self._verdict(line.split('. ', 1)[1])})
+                                for number, line in enumerate(lines, 1))
+        else:
+            content = json.dumps(self._verdict(user_message))
+        if not payload.get("stream"):
+            return web.json_response({"choices": [{"message": {"content": content}}]})
+
+        # Потоковый ответ фрагментами по несколько символов, как токены модели
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        try:
+            for start in range(0, len(content), 4):
+                chunk = {"choices": [{"delta": {"content": content[start:start + 4]}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                await asyncio.sleep(self.token_latency)
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionError:
+            pass  # Клиент получил вердикт и закрыл соединение
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def read_log(path, encoding):
+    """Строки лога с временем в секундах от полуночи (с учётом перехода через полночь)."""
+    day_offset = 0
+    previous = 0
+    with open(path, 'r', encoding=encoding, errors='replace') as f:
+        for line in f:
+            match = timestamp_pattern.match(line)
+            if match:
+                seconds = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + int(match.group(3))
+                if seconds + day_offset < previous - 12 * 3600:
+                    day_offset += 24 * 3600
+                previous = seconds + day_offset
+            yield previous, line.rstrip('\r\n')
+
+
+def merged_lines(paths, names, encoding):
+    """Строки нескольких логов, упорядоченные по времени: (время, сервер, строка)."""
+    def stream(path, name):
+        for seconds, line in read_log(path, encoding):
+            yield seconds, name, line
+
+    return heapq.merge(*(stream(path, name) for path, name in zip(paths, names)), key=lambda item: item[0])
+
+
+async def replay(args):
+    # Импортируем конвейер только после подготовки config
+    import log_monitor
+    import telegram_notifier
+    from ai_request import moderation_client
+    from chat_parser import parse_line
+    from keyword_matcher import KeywordMatcher
+    from pre_classifier import pre_classifier
+    from verdict_cache import verdict_cache
+    from verdict_batcher import verdict_batcher
+    from work_queue import MessageQueue
+
+    timings = StageTimings()
+    sent_notifications = []
+    enqueue_times = {}
+
+    # Модель предварительной проверки (если обучена) загружается так же, как при запуске бота
+    pre_classifier.load()
+
+    llm_server = FakeLLMServer(args.llm_latency, args.llm_jitter, args.violation_rate, args.seed,
+                               args.llm_token_latency)
+    moderation_client.url = await llm_server.start()
+
+    # Замеры этапов: оборачиваем функции конвейера
+    search = KeywordMatcher.search
+
+    def timed_search(matcher, text):
+        start = time.perf_counter()
+        result = search(matcher, text)
+        timings.add('keyword', time.perf_counter() - start)
+        return result
+
+    KeywordMatcher.search = timed_search
+
+    check_with_neural_network = log_monitor.check_with_neural_network
+
+    async def timed_check(message, chat_type, normalized):
+        start = time.perf_counter()
+        try:
+            return await check_with_neural_network(message, chat_type, normalized)
+        finally:
+            timings.add('llm', time.perf_counter() - start)
+
+    log_monitor.check_with_neural_network = timed_check
+
+    if args.no_cache:
+        verdict_cache.max_size = 0
+
+    notification_queue = telegram_notifier.notification_queue
+    notification_queue.bucket.rate = args.telegram_rate
+    notification_queue.bucket.capacity = args.telegram_rate
+    enqueue = notification_queue.enqueue
+
+    def timed_enqueue(text):
+        enqueue_times.setdefault(text, []).append(time.perf_counter())
+        enqueue(text)
+
+    notification_queue.enqueue = timed_enqueue
+
+    async def fake_send(text):
+        now = time.perf_counter()
+        for part in text.split("\n"):
+            queued = enqueue_times.get(part)
+            if queued:
+                timings.add('notify', now - queued.pop(0))
+        sent_notifications.append(text)
+
+    notification_queue.send = fake_send
+
+    # Очереди по серверам, как в monitor_log
+    names = args.names or [os.path.splitext(os.path.basename(path))[0] for path in args.logs]
+    queues = {}
+    for name in names:
+        queue = MessageQueue(name, log_monitor.process_chat_line,
+                             degraded_handler=log_monitor.process_chat_line_keywords_only)
+        queue.start()
+        queues[name] = queue
+
+    if args.trace_memory:
+        tracemalloc.start()
+    total_lines = 0
+    chat_lines = 0
+    first_log_time = None
+    started = time.perf_counter()
+
+    for log_time, server, line in merged_lines(args.logs, names, args.encoding):
+        total_lines += 1
+        if args.speed != 'max':
+            if first_log_time is None:
+                first_log_time = log_time
+            delay = (log_time - first_log_time) / float(args.speed) - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        start = time.perf_counter()
+        chat_line = parse_line(line, server)
+        timings.add('parse', time.perf_counter() - start)
+        if chat_line is not None:
+            chat_lines += 1
+            queues[server].put(chat_line)
+
+        # Даём поработать обработчикам очередей
+        if total_lines % 256 == 0:
+            await asyncio.sleep(0)
+
+    read_time = time.perf_counter() - started
+    for queue in queues.values():
+        await queue.join()
+    verdict_batcher.flush_all()
+    await notification_queue.stop(timeout=60)
+    elapsed = time.perf_counter() - started
+    if args.trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_memory_text = f"{peak_memory / 1024 / 1024:.1f} МБ (tracemalloc)"
+    elif resource is not None:
+        # ru_maxrss в Linux - в килобайтах
+        peak_memory_text = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} МБ (RSS процесса)"
+    else:
+        peak_memory_text = "неизвестно, запустите с --trace-memory"
+
+    for queue in queues.values():
+        await queue.stop()
+    await moderation_client.close()
+    await llm_server.stop()
+
+    print(f"Строк: {total_lines}, сообщений чата: {chat_lines}")
+    print(f"Чтение и разбор: {read_time:.2f} с, весь прогон: {elapsed:.2f} с, "
+          f"{total_lines / elapsed:,.0f} строк/с, {chat_lines / elapsed:,.1f} сообщений/с")
+    print("Задержки этапов:")
+    print(timings.report())
+    print(f"Запросов к нейросети: {llm_server.calls}, кэш вердиктов: {verdict_cache.stats()}")
+    print(f"Уведомлений в Telegram: {sum(len(text.splitlines()) for text in sent_notifications)} "
+          f"в {len(sent_notifications)} сообщениях")
+    for name, queue in queues.items():
+        print(f"Очередь {name}: {queue.stats()}")
+    print(f"Пик памяти: {peak_memory_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон записанных логов через конвейер модерации")
+    parser.add_argument('logs', nargs='+', help='Записанные логи клиента')
+    parser.add_argument('--names', nargs='+', help='Названия серверов для логов (по умолчанию - имена файлов)')
+    parser.add_argument('--encoding', default='cp1251')
+    parser.add_argument('--speed', default='max', help="Скорость: 'max' или множитель реального времени (1, 10, ...)")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='Задержка ответа нейросети, с')
+    parser.add_argument('--llm-jitter', type=float, default=0.1, help='Разброс задержки нейросети, с')
+    parser.add_argument('--llm-token-latency', type=float, default=0.02,
+                        help='Пауза между фрагментами потокового ответа нейросети, с')
+    parser.add_argument('--violation-rate', type=float, default=0.05, help='Доля сообщений с нарушением')
+    parser.add_argument('--telegram-rate', type=float, default=1000.0, help='Лимит отправки в Telegram, сообщений/с')
+    parser.add_argument('--no-cache', action='store_true', help='Отключить кэш вердиктов')
+    parser.add_argument('--trace-memory', action='store_true', help='Точный пик памяти через tracemalloc (медленнее)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.names and len(args.names) != len(args.logs):
+        parser.error("Число названий серверов должно совпадать с числом логов")
+    if args.speed != 'max':
+        try:
+            float(args.speed)
+        except ValueError:
+            parser.error("--speed должен быть 'max' или числом")
+
+    # Логи конвейера не нужны в bot.log: выводим только предупреждения и ошибки в консоль
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    asyncio.run(replay(args))
+
+
+if __name__ == '__main__':
+    main()
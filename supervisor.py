@@ -0,0 +1,187 @@
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+import metrics
+from chat_parser import ChatLine
+from log_worker import run_worker
+from logging_setup import forward_worker_logs
+from log_tailer import OffsetCommitter
+from log_monitor import create_message_queue, message_queues, tail_offsets
+
+# Пауза перед перезапуском упавшего процесса, удваивается при повторных падениях (в секундах)
+RESTART_DELAY = 1.0
+RESTART_DELAY_MAX = 60.0
+
+# Процесс, проработавший дольше этого времени, считается стабильным и сбрасывает паузу
+STABLE_UPTIME = 60.0
+
+
+class Worker:
+    """Рабочий процесс, читающий логи нескольких серверов."""
+
+    def __init__(self, worker_id, servers):
+        self.worker_id = worker_id
+        self.servers = servers
+        self.process = None
+        self.connection = None
+        self.stop_event = None
+        self.reader = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_delay = RESTART_DELAY
+
+
+class Supervisor:
+    """
+    Распределяет чтение и разбор логов серверов по нескольким процессам.
+    Сообщения чата приходят в основной процесс пачками и попадают в очереди серверов,
+    так что нейросеть и Telegram остаются общими с едиными лимитами.
+    """
+
+    def __init__(self, servers, processes, encoding='cp1251'):
+        self.encoding = encoding
+        self._context = multiprocessing.get_context('spawn')
+        # Записи лога рабочих процессов: основной процесс пишет их в bot.log вместе со своими
+        self._log_queue = self._context.Queue()
+        self._log_listener = None
+        processes = max(1, min(processes, len(servers)))
+        self.workers = [Worker(worker_id, servers[worker_id::processes]) for worker_id in range(processes)]
+        self.health = {server["name"]: {"worker": worker.worker_id, "restarts": 0}
+                       for worker in self.workers for server in worker.servers}
+        # Сохранение позиций после обработки и последние позиции, полученные от процессов
+        self.committers = {server["name"]: OffsetCommitter(server["log_path"], tail_offsets)
+                           for worker in self.workers for server in worker.servers}
+        self.received = {}
+        self._loop = None
+        self._stopping = False
+
+    # Откуда продолжить чтение: перезапущенный процесс не должен заново присылать
+    # сообщения, которые уже стоят в очередях
+    def _start_offsets(self, worker):
+        offsets = {}
+        for server in worker.servers:
+            path = server["log_path"]
+            if path in self.received:
+                inode, offset = self.received[path]
+                offsets[path] = {"inode": inode, "offset": offset}
+            elif tail_offsets.get(path) is not None:
+                offsets[path] = tail_offsets.get(path)
+        return offsets
+
+    def _start_worker(self, worker):
+        parent_connection, child_connection = self._context.Pipe(duplex=False)
+        worker.connection = parent_connection
+        worker.stop_event = self._context.Event()
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(worker.worker_id, worker.servers, child_connection, worker.stop_event, self.encoding,
+                  self._start_offsets(worker), self._log_queue),
+            name=f"log-worker-{worker.worker_id}",
+            daemon=True
+        )
+        worker.process.start()
+        child_connection.close()
+        worker.started_at = time.monotonic()
+
+        # Чтение из канала блокирующее, поэтому в отдельном потоке
+        worker.reader = threading.Thread(target=self._read, args=(worker, parent_connection), daemon=True)
+        worker.reader.start()
+        logging.info(f"Запущен процесс чтения логов #{worker.worker_id} (pid {worker.process.pid})")
+
+    def _read(self, worker, connection):
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+            self._loop.call_soon_threadsafe(self._dispatch, worker, message)
+
+    def _dispatch(self, worker, message):
+        kind, payload = message
+        if kind == 'lines':
+            for timestamp, channel, player, text, server in payload:
+                metrics.chat_lines.inc(server=server, channel=channel)
+                chat_line = ChatLine(timestamp, channel, player, text, server)
+                self.committers[server].hold(chat_line)
+                message_queues[server].put(chat_line)
+        elif kind == 'positions':
+            for server in worker.servers:
+                position = payload.get(server["log_path"])
+                if position is not None:
+                    self.received[server["log_path"]] = position
+                    self.committers[server["name"]].seal(*position)
+        elif kind == 'health':
+            for server, health in payload.items():
+                # Счётчик строк в процессе обнуляется при его перезапуске
+                previous_lines = self.health.get(server, {}).get("lines", 0)
+                lines = health["lines"]
+                metrics.log_lines.inc(lines - previous_lines if lines >= previous_lines else lines, server=server)
+                if health["lag_bytes"] is not None:
+                    metrics.tail_lag_bytes.set(health["lag_bytes"], server=server)
+                    metrics.tail_lag_seconds.set(health["lag_seconds"], server=server)
+
+                health.update(worker=worker.worker_id, restarts=worker.restarts, updated_at=time.time())
+                self.health[server] = health
+
+    async def _watch(self):
+        while not self._stopping:
+            await asyncio.sleep(1.0)
+            for worker in self.workers:
+                if worker.process.is_alive() or self._stopping:
+                    continue
+
+                uptime = time.monotonic() - worker.started_at
+                if uptime >= STABLE_UPTIME:
+                    worker.restart_delay = RESTART_DELAY
+                logging.error(f"Процесс чтения логов #{worker.worker_id} завершился с кодом {worker.process.exitcode}, "
+                              f"перезапуск через {worker.restart_delay:.0f} с")
+                worker.connection.close()
+                await asyncio.sleep(worker.restart_delay)
+                worker.restart_delay = min(worker.restart_delay * 2, RESTART_DELAY_MAX)
+                worker.restarts += 1
+                if not self._stopping:
+                    self._start_worker(worker)
+
+    async def report_health(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            for server, health in self.health.items():
+                if "lines" not in health:
+                    logging.warning(f"Сервер {server}: нет данных от процесса #{health['worker']}")
+                    continue
+                lag = f"{health['lag_bytes']} байт / {health['lag_seconds']:.1f} с" if health['lag_bytes'] is not None \
+                    else "файл недоступен"
+                logging.info(f"Сервер {server} (процесс #{health['worker']}, перезапусков {health['restarts']}): "
+                             f"строк {health['lines']}, сообщений чата {health['chat_lines']}, отставание {lag}")
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._log_listener = forward_worker_logs(self._log_queue)
+        for worker in self.workers:
+            for server in worker.servers:
+                message_queues[server["name"]] = create_message_queue(server["name"], self.committers[server["name"]])
+        for worker in self.workers:
+            self._start_worker(worker)
+        await asyncio.gather(self._watch(), self.report_health())
+
+    async def stop(self, timeout=5.0):
+        self._stopping = True
+        for worker in self.workers:
+            if worker.stop_event is not None:
+                worker.stop_event.set()
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            await asyncio.to_thread(worker.process.join, timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.reader is not None:
+                await asyncio.to_thread(worker.reader.join, timeout)
+        if self._log_listener is not None:
+            # Дописываем последние записи завершившихся процессов
+            await asyncio.to_thread(self._log_listener.stop)
+            self._log_listener = None
+        # Очереди дообрабатывает main, после чего позиции сохраняются в контрольной точке
@@ -1,8 +1,203 @@
+import time
+import asyncio
 import logging
+from collections import deque
+from datetime import datetime
 from telegram import Bot
+from telegram.error import RetryAfter
 import config  # Подключаем файл с конфигурацией
+import metrics
+
+# Ограничение скорости отправки: Telegram допускает около 20 сообщений в минуту в группу
+TELEGRAM_RATE = getattr(config, 'TELEGRAM_RATE', 20 / 60)  # сообщений в секунду
+TELEGRAM_BURST = getattr(config, 'TELEGRAM_BURST', 3)
+
+# Уведомления, пришедшие в течение этого окна (в секундах), объединяются в одно сообщение
+TELEGRAM_COALESCE_WINDOW = getattr(config, 'TELEGRAM_COALESCE_WINDOW', 1.0)
+
+# Сколько уведомлений может ждать отправки и сколько раз повторять неудачную отправку
+TELEGRAM_MAX_BACKLOG = getattr(config, 'TELEGRAM_MAX_BACKLOG', 500)
+TELEGRAM_MAX_RETRIES = getattr(config, 'TELEGRAM_MAX_RETRIES', 5)
+
+# Максимальная длина сообщения в Telegram
+TELEGRAM_MAX_LENGTH = 4096
+
+# Бот создаётся при первой отправке и закрывается при остановке через close_bot()
+_bot = None
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        self._refill()
+        while self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+            self._refill()
+        self._tokens -= 1
+
+    # После 429 от Telegram не отправляем ничего, пока не истечёт retry_after
+    def pause(self, seconds):
+        self._tokens = 0
+        self._updated = time.monotonic() + seconds
+
+
+class NotificationQueue:
+    """
+    Очередь исходящих уведомлений. Модерация только ставит текст в очередь,
+    а отправкой с учётом лимитов Telegram, объединением и повторами занимается отдельная задача.
+    """
+
+    def __init__(self, send, rate=TELEGRAM_RATE, burst=TELEGRAM_BURST, coalesce_window=TELEGRAM_COALESCE_WINDOW,
+                 max_backlog=TELEGRAM_MAX_BACKLOG, max_retries=TELEGRAM_MAX_RETRIES):
+        """
+        :param send: Корутина отправки одного текста в Telegram
+        """
+        self.send = send
+        self.bucket = TokenBucket(rate, burst)
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self._backlog = deque(maxlen=max_backlog)
+        self._not_empty = asyncio.Event()
+        self._task = None
+        self._in_flight = 0  # уведомлений в отправляемом сейчас сообщении
+
+        # Статистика
+        self.sent = 0
+        self.dropped = 0
+        self.rate_limited = 0
+
+    def __len__(self):
+        return len(self._backlog)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="telegram-notifications")
+
+    def enqueue(self, text):
+        if len(self._backlog) == self._backlog.maxlen:
+            self.dropped += 1
+            logging.error(f"Очередь уведомлений переполнена, уведомление потеряно: {self._backlog[0]}")
+        self._backlog.append(text)
+        self._not_empty.set()
+        self.start()
+
+    def _backlog_fills_message(self):
+        length = 0
+        for text in self._backlog:
+            length += len(text) + 1
+            if length > TELEGRAM_MAX_LENGTH:
+                return True
+        return False
+
+    # Забираем из очереди столько уведомлений, сколько поместится в одно сообщение
+    def _take_batch(self):
+        texts = [self._backlog.popleft()]
+        length = len(texts[0])
+        while self._backlog and length + 1 + len(self._backlog[0]) <= TELEGRAM_MAX_LENGTH:
+            text = self._backlog.popleft()
+            texts.append(text)
+            length += 1 + len(text)
+        return texts
+
+    async def _run(self):
+        while True:
+            while not self._backlog:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+
+            # Даём набраться всплеску уведомлений, чтобы отправить их одним сообщением,
+            # если накопленного ещё не хватает на целое сообщение
+            if not self._backlog_fills_message():
+                await asyncio.sleep(self.coalesce_window)
+            texts = self._take_batch()
+            self._in_flight = len(texts)
+            try:
+                await self._send_with_retries(texts)
+            finally:
+                self._in_flight = 0
+
+    async def _send_with_retries(self, texts):
+        text = "\n".join(texts)
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                with metrics.telegram_send_latency.time():
+                    await self.send(text)
+                metrics.telegram_sends.inc(status='ok')
+                self.sent += 1
+                logging.info(f"Отправлено уведомление ({len(texts)} шт.): {text}")
+                return
+            except RetryAfter as e:
+                self.rate_limited += 1
+                metrics.telegram_sends.inc(status='rate_limited')
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                logging.warning(f"Лимит Telegram, повтор через {delay} с")
+                self.bucket.pause(delay)
+            except Exception as e:
+                metrics.telegram_sends.inc(status='error')
+                logging.error(f"Ошибка при отправке уведомления (попытка {attempt + 1}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 60))
+
+        self.dropped += len(texts)
+        logging.error(f"Уведомление не отправлено после {self.max_retries + 1} попыток: {text}")
+
+    async def stop(self, timeout=None):
+        if self._task is None:
+            return
+        if timeout:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                # Сообщение, которое отправляется прямо сейчас, тоже теряется
+                lost = len(self._backlog) + self._in_flight
+                self.dropped += lost
+                logging.warning(f"Не успели отправить {lost} уведомлений")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _drain(self):
+        while self._backlog or self._in_flight:
+            await asyncio.sleep(0.05)
+
+
+def get_bot():
+    global _bot
+    if _bot is None:
+        _bot = Bot(token=config.TELEGRAM_TOKEN)
+    return _bot
+
+
+async def close_bot():
+    """Закрывает HTTP-соединения бота; вызывается после отправки оставшихся уведомлений."""
+    global _bot
+    bot, _bot = _bot, None
+    if bot is not None and hasattr(bot, 'shutdown'):
+        try:
+            await bot.shutdown()
+        except Exception as e:
+            logging.error(f"Ошибка при закрытии бота Telegram: {e}")
+
+
+async def send_to_chat(text):
+    await get_bot().send_message(chat_id=config.CHAT_ID, text=text)
+
+
+notification_queue = NotificationQueue(send_to_chat)
+metrics.telegram_backlog.set_function(lambda: len(notification_queue))
 
-bot = Bot(token=config.TELEGRAM_TOKEN)
 
 # Отправка уведомлений о нарушениях в Telegram
 async def send_telegram_notification(channel, player_name, message, rule_violation=None, detailed=False,
@@ -29,19 +224,15 @@ async def send_telegram_notification(channel, player_name, message, rule_violati
         # Стандартное сообщение о нарушении
         text = f"Нарушение: {rule_violation} ({channel}) {player_name}: {message}"
 
-    try:
-        await bot.send_message(chat_id=config.CHAT_ID, text=text)
-        logging.info(f"Отправлено уведомление: {text}")
-    except Exception as e:
-        logging.error(f"Ошибка при отправке уведомления: {e}")
+    # Только ставим в очередь: отправка не задерживает обработку сообщений
+    notification_queue.enqueue(text)
 
 # Отправка уведомлений о ключевых словах в Telegram
 async def send_telegram_alert(channel, player_name, message):
     text = f"({channel}) {player_name}: {message}"
-    try:
-        await bot.send_message(chat_id=config.CHAT_ID, text=text)
-        logging.info(f"Отправлено уведомление о сообщении игрока {player_name}")
-    except Exception as e:
-        logging.error(f"Ошибка при отправке уведомления: {e}")
-
+    notification_queue.enqueue(text)
 
+# Одно уведомление на всю волну флуда
+async def send_telegram_flood_alert(channel, player_name, message, description):
+    text = f"Флуд ({channel}) {player_name}: {description}. Сообщение: {message}"
+    notification_queue.enqueue(text)
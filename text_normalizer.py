@@ -0,0 +1,100 @@
+import re
+
+# Латинские буквы, похожие на кириллицу, и замены букв цифрами/символами.
+# Заменяются только в словах, где уже есть кириллица или латиница смешана с цифрами:
+# слова целиком на латинице ("block", "table") остаются как есть и совпадают
+# только с латинскими словами из списков
+HOMOGLYPHS = {
+    'a': 'а', 'b': 'б', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м', 'n': 'п',
+    'o': 'о', 'p': 'р', 'r': 'г', 't': 'т', 'u': 'и', 'x': 'х', 'y': 'у', 'ё': 'е',
+}
+# Остальные латинские буквы - по транслиту: "bl9" -> "бля", "ebat" -> "ебат"
+TRANSLITERATION = {
+    'd': 'д', 'f': 'ф', 'g': 'г', 'i': 'и', 'j': 'й', 'l': 'л', 'q': 'к', 's': 'с',
+    'v': 'в', 'w': 'ш', 'z': 'з',
+}
+# Сочетания латинских букв, которыми пишут одну русскую: "blyat" -> "блят", "suchka" -> "сучка"
+DIGRAPHS = {
+    'ya': 'я', 'yu': 'ю', 'yo': 'е', 'ch': 'ч', 'sh': 'ш', 'zh': 'ж',
+}
+LEETSPEAK = {
+    '0': 'о', '3': 'з', '4': 'ч', '6': 'б', '9': 'я', '@': 'а',
+}
+
+# Символы, которыми разбивают слова: "х.е.р", "б-л-я"
+SEPARATORS = '.,-_*\'"`~|/\\:;!?+=()[]{}<>^#%&'
+
+# Таблицы для str.translate: разделители удаляются до замены сочетаний ("b.l.y.a"), буквы заменяются после
+separators_table = str.maketrans({separator: None for separator in SEPARATORS})
+translation_table = str.maketrans({
+    **HOMOGLYPHS,
+    **TRANSLITERATION,
+    **LEETSPEAK,
+})
+
+color_code_pattern = re.compile(r'§.')
+token_pattern = re.compile(r'\S+')
+cyrillic_pattern = re.compile('[а-яё]')
+latin_pattern = re.compile('[a-z]')
+leetspeak_pattern = re.compile('[' + re.escape(''.join(LEETSPEAK)) + ']')
+foldable_pattern = re.compile('[a-z' + re.escape(''.join(LEETSPEAK)) + 'ё]')
+digraph_pattern = re.compile('|'.join(DIGRAPHS))
+repeated_chars_pattern = re.compile(r'(.)\1+')
+whitespace_pattern = re.compile(r'\s+')
+
+
+# Замена латиницы и цифр на русские буквы в слове с кириллицей ("6лять", "xуй") или
+# смешанном из латиницы и цифр ("bl9"); слова только из латиницы или только из цифр не трогаются
+def fold_token(token):
+    if cyrillic_pattern.search(token) or (latin_pattern.search(token) and leetspeak_pattern.search(token)):
+        token = digraph_pattern.sub(lambda match: DIGRAPHS[match.group()], token)
+        return token.translate(translation_table)
+    return token
+
+
+# Приведение сообщения к каноническому виду для поиска запрещённых слов:
+# без цветовых кодов, регистра, латиницы и цифр вместо русских букв, разделителей и повторов
+def normalize(text):
+    text = color_code_pattern.sub('', text).lower().translate(separators_table)
+    if foldable_pattern.search(text):
+        text = token_pattern.sub(lambda match: fold_token(match.group()), text)
+    text = repeated_chars_pattern.sub(r'\1', text)
+    return whitespace_pattern.sub(' ', text).strip()
+
+
+# Лёгкая нормализация для ключа кэша вердиктов: без цветовых кодов, регистра, повторов
+# и лишних пробелов. Латиница, цифры и знаки сохраняются: "privet" и "привет", "1:0" и "10"
+# для нейросети - разные сообщения
+def simplify(text):
+    text = repeated_chars_pattern.sub(r'\1', color_code_pattern.sub('', text).lower())
+    return whitespace_pattern.sub(' ', text).strip()
+
+
+# Нормализация списка слов тем же способом, что и сообщения
+def normalize_words(words):
+    return [normalized for normalized in (normalize(word) for word in words) if normalized]
+
+
+# Слова, на которых раньше срабатывал короткий запрещённый фрагмент "бл", и попытки обхода,
+# которые должны ловиться. Проверка по текущим спискам: python text_normalizer.py
+NOT_BANNED = [
+    "block", "table", "problem", "cobblestone", "blaze rod", "sell diamond block",
+    "Applied Energistics crafting table",
+]
+BANNED = ["бл9", "bl9", "blyat", "6ля", "b.l.9", "х.е.р", "xер"]
+
+
+if __name__ == '__main__':
+    import sys
+    from data_loader import read_lines
+    from keyword_matcher import KeywordMatcher
+
+    matcher = KeywordMatcher({'banned': normalize_words(read_lines('texts/banned_words.txt'))})
+    failed = [f"{message!r} -> {normalize(message)!r}: {matcher.search(normalize(message)).get('banned')}"
+              for message in NOT_BANNED if 'banned' in matcher.search(normalize(message))]
+    failed += [f"{message!r} -> {normalize(message)!r}: не найдено"
+               for message in BANNED if 'banned' not in matcher.search(normalize(message))]
+    for line in failed:
+        print(line)
+    print(f"Проверено {len(NOT_BANNED) + len(BANNED)} сообщений, ошибок: {len(failed)}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import config
+from data_loader import read_lines, read_text
+from keyword_matcher import KeywordMatcher
+from text_normalizer import normalize_words
+
+# Как часто проверять файлы на изменения (в секундах)
+TEXTS_CHECK_INTERVAL = getattr(config, 'TEXTS_CHECK_INTERVAL', 2.0)
+
+# Списки слов
+WORD_LIST_FILES = {
+    'banned': 'texts/banned_words.txt',  # Ключевые слова для нарушений
+    'notification': 'texts/notification_keywords.txt',  # Ключевые слова для уведомлений
+    'whitelist': 'texts/whitelist.txt',  # Слова, которые не будут уведомляться
+    'trade': 'texts/trade_chat.txt',  # Слова, которые разрешены только в торговом чате
+}
+
+# Системные промпты для разных типов чата
+PROMPT_FILES = {
+    'глобальный': 'texts/prompt_global.txt',
+    'торговый': 'texts/prompt_trade.txt',
+    'default': 'texts/default_prompt.txt',
+    'format': 'texts/prompt_format.txt',  # Формат ответа: JSON-вердикт
+    'batch': 'texts/prompt_batch.txt',  # Формат ответа при пакетной проверке: JSON-вердикт на каждое сообщение
+}
+
+
+class TextSnapshot:
+    """Неизменяемый набор загруженных списков, собранных автоматов и промптов."""
+
+    def __init__(self, word_lists, prompts):
+        self.word_lists = word_lists
+        self.prompts = prompts
+        # Версия промпта - короткий хэш его содержимого
+        self.prompt_versions = {name: hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+                                for name, text in prompts.items()}
+
+        # Белый список сверяется с сообщением как есть: это точные фразы, а не попытки обхода фильтра
+        self.whitelist_matcher = KeywordMatcher({'whitelist': word_lists['whitelist']})
+
+        # Единый автомат по остальным спискам, работает с нормализованным текстом,
+        # чтобы ловить замаскированные слова ("x.е.р", "бл9", "пзздц")
+        self.keyword_matcher = KeywordMatcher({
+            'notification': normalize_words(word_lists['notification']),
+            'banned': normalize_words(word_lists['banned']),
+            'trade': normalize_words(word_lists['trade']),
+        })
+
+
+class TextRegistry:
+    """
+    Загружает списки слов и промпты один раз и следит за изменениями файлов.
+    Изменённые файлы перечитываются, новый TextSnapshot собирается целиком и
+    подменяет старый одним присваиванием, так что обработка сообщений всегда видит
+    согласованные данные и не читает диск. Если файл не читается или внезапно стал
+    пустым, остаётся его предыдущее содержимое.
+    """
+
+    def __init__(self, word_list_files=WORD_LIST_FILES, prompt_files=PROMPT_FILES):
+        self.word_list_files = word_list_files
+        self.prompt_files = prompt_files
+        self._mtimes = {}
+        self.snapshot = self._build(previous=None)
+
+    def _mtime(self, filename):
+        try:
+            return os.stat(filename).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self, filename, reader, previous, empty):
+        try:
+            content = reader(filename)
+        except Exception as e:
+            if previous is None:
+                logging.error(f"Ошибка при загрузке {filename}: {e}")
+                return empty
+            logging.error(f"Ошибка при загрузке {filename}: {e}. Оставлено предыдущее содержимое.")
+            return previous
+
+        if not content and previous:
+            logging.error(f"Файл {filename} оказался пустым. Оставлено предыдущее содержимое.")
+            return previous
+        return content
+
+    def _build(self, previous):
+        word_lists = {}
+        for name, filename in self.word_list_files.items():
+            self._mtimes[filename] = self._mtime(filename)
+            word_lists[name] = self._read(filename, read_lines, previous and previous.word_lists[name], [])
+
+        prompts = {}
+        for name, filename in self.prompt_files.items():
+            self._mtimes[filename] = self._mtime(filename)
+            prompts[name] = self._read(filename, read_text, previous and previous.prompts[name], "")
+
+        return TextSnapshot(word_lists, prompts)
+
+    def changed_files(self):
+        return [filename for filename, mtime in self._mtimes.items() if self._mtime(filename) != mtime]
+
+    def reload(self):
+        start = time.perf_counter()
+        snapshot = self._build(previous=self.snapshot)
+        self.snapshot = snapshot
+        logging.info(f"Списки слов и промпты перезагружены за {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    async def watch(self, interval=TEXTS_CHECK_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            changed = self.changed_files()
+            if changed:
+                logging.info(f"Изменились файлы: {', '.join(changed)}")
+                # Сборка автоматов для больших списков может занять заметное время - не в event loop
+                await asyncio.to_thread(self.reload)
+
+    # Промпт и его версия для типа чата
+    def prompt(self, chat_type):
+        return self.snapshot.prompts.get(chat_type, self.snapshot.prompts['default'])
+
+    def prompt_version(self, chat_type):
+        versions = self.snapshot.prompt_versions
+        return versions.get(chat_type, versions['default'])
+
+
+text_registry = TextRegistry()
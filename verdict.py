@@ -0,0 +1,115 @@
+import re
+import json
+
+# JSON-объект вердикта в ответе нейросети: {"violation": true, "rule": "2.1", "duration": 10}
+verdict_object_pattern = re.compile(r'\{[^{}]*\}')
+rule_code_pattern = re.compile(r'\d+(?:\.\d+)*')
+
+
+# "1 минута", "3 минуты", "10 минут" - так же, как длительность записана в наказаниях
+def format_minutes(minutes):
+    if minutes % 10 == 1 and minutes % 100 != 11:
+        word = "минута"
+    elif minutes % 10 in (2, 3, 4) and minutes % 100 not in (12, 13, 14):
+        word = "минуты"
+    else:
+        word = "минут"
+    return f"{minutes} {word}"
+
+
+class Verdict:
+    """
+    Решение по сообщению: есть ли нарушение, пункт правил и рекомендуемый мут в минутах.
+    error - текст ошибки, если нейросеть не смогла проверить сообщение.
+    raw - ответ нейросети как есть (для журнала), в to_dict() и кэш не попадает.
+    """
+    __slots__ = ('violation', 'rule', 'duration', 'comment', 'error', 'raw')
+
+    def __init__(self, violation, rule=None, duration=None, comment=None, error=None, raw=None):
+        self.violation = violation
+        self.rule = rule
+        self.duration = duration
+        self.comment = comment
+        self.error = error
+        self.raw = raw
+
+    @classmethod
+    def failed(cls, error, raw=None):
+        return cls(False, error=error, raw=raw)
+
+    def describe(self):
+        if self.error:
+            return self.error
+        if self.violation:
+            text = f"п. {self.rule}" if self.rule else "Нарушение"
+            if self.duration:
+                text += f", мут на {format_minutes(self.duration)}"
+        else:
+            text = "Нарушений нет"
+        if self.comment:
+            text += f" ({self.comment})"
+        return text
+
+    def __repr__(self):
+        return f"Verdict({self.describe()!r})"
+
+    def to_dict(self):
+        data = {"violation": self.violation}
+        for name in ('rule', 'duration', 'comment', 'error'):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(bool(data["violation"]), data.get("rule"), data.get("duration"), data.get("comment"),
+                   data.get("error"))
+
+
+def _parse_duration(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value > 0 else None
+    if isinstance(value, str):
+        match = re.search(r'\d+', value)
+        return int(match.group()) if match and int(match.group()) > 0 else None
+    return None
+
+
+def verdict_from_object(data):
+    """Verdict из разобранного JSON-объекта ответа или None, если поля violation нет."""
+    violation = data.get("violation")
+    if isinstance(violation, str):
+        violation = violation.strip().lower() in ("true", "1", "да")
+    elif not isinstance(violation, (bool, int)):
+        return None
+
+    if not violation:
+        return Verdict(False)
+    rule = data.get("rule")
+    match = rule_code_pattern.search(str(rule)) if rule is not None else None
+    return Verdict(True, match.group() if match else None, _parse_duration(data.get("duration")))
+
+
+def find_verdict_objects(text):
+    """Все JSON-объекты в тексте ответа по порядку; мусор между ними пропускается."""
+    objects = []
+    for match in verdict_object_pattern.finditer(text):
+        try:
+            data = json.loads(match.group())
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            objects.append(data)
+    return objects
+
+
+def parse_verdict(text):
+    """Первый вердикт в ответе нейросети или None, если ответ не в ожидаемом формате."""
+    for data in find_verdict_objects(text):
+        verdict = verdict_from_object(data)
+        if verdict is not None:
+            return verdict
+    return None
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import config
+from ai_request import generate_response, generate_batch_response, is_error_response
+from verdict import Verdict, find_verdict_objects, verdict_from_object
+
+# Сколько ждать накопления сообщений перед отправкой пакета (в секундах)
+BATCH_WINDOW = getattr(config, 'BATCH_WINDOW', 0.5)
+
+# Максимальное число сообщений в одном запросе к нейросети
+BATCH_MAX_SIZE = getattr(config, 'BATCH_MAX_SIZE', 8)
+
+# Разбор пакетного ответа. Возвращает список вердиктов в порядке сообщений
+# или None, если ответ не удалось однозначно сопоставить с сообщениями
+def parse_batch_response(response, count):
+    verdicts = {}
+    for data in find_verdict_objects(response):
+        number = data.get("n")
+        if not isinstance(number, int) or not 1 <= number <= count or number in verdicts:
+            continue
+        verdict = verdict_from_object(data)
+        if verdict is not None:
+            verdicts[number] = verdict
+
+    if len(verdicts) != count:
+        return None
+    return [verdicts[number] for number in range(1, count + 1)]
+
+
+class VerdictBatcher:
+    """
+    Собирает сообщения одного типа чата в течение короткого окна (или до BATCH_MAX_SIZE)
+    и проверяет их одним запросом к нейросети. Каждый вызов classify получает свой вердикт.
+    """
+
+    def __init__(self, window=BATCH_WINDOW, max_size=BATCH_MAX_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._pending = {}  # chat_type -> [(message, future)]
+        self._timers = {}  # chat_type -> asyncio.TimerHandle
+        self._tasks = set()
+
+    async def classify(self, message, chat_type):
+        if self.max_size <= 1:
+            return await generate_response(message, chat_type)
+
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(chat_type, [])
+        pending.append((message, future))
+
+        if len(pending) >= self.max_size:
+            self._flush(chat_type)
+        elif chat_type not in self._timers:
+            self._timers[chat_type] = asyncio.get_running_loop().call_later(self.window, self._flush, chat_type)
+
+        return await future
+
+    def _flush(self, chat_type):
+        timer = self._timers.pop(chat_type, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(chat_type, [])
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._run_batch(batch, chat_type))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch, chat_type):
+        messages = [message for message, _ in batch]
+        try:
+            verdicts = None
+            if len(batch) > 1:
+                response = await generate_batch_response(messages, chat_type)
+                if is_error_response(response):
+                    # Нейросеть недоступна: повторять запросы по одному бессмысленно
+                    verdicts = [Verdict.failed(response)] * len(batch)
+                else:
+                    verdicts = parse_batch_response(response, len(batch))
+                    for verdict in verdicts or ():
+                        # В журнал попадает весь пакетный ответ: по нему видно и соседние вердикты
+                        verdict.raw = response
+                    if verdicts is None:
+                        logging.warning(f"Не удалось разобрать пакетный ответ нейросети, проверяем по одному: {response}")
+
+            if verdicts is None:
+                # Запасной путь: отдельный запрос на каждое сообщение
+                verdicts = await asyncio.gather(*(generate_response(message, chat_type) for message in messages))
+
+            for (_, future), verdict in zip(batch, verdicts):
+                if not future.done():
+                    future.set_result(verdict)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    # Немедленно отправляем всё накопленное (например, при остановке)
+    def flush_all(self):
+        for chat_type in list(self._pending):
+            self._flush(chat_type)
+
+
+verdict_batcher = VerdictBatcher()
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+import config
+import metrics
+from verdict import Verdict
+
+# Размер кэша вердиктов и время жизни записи (в секундах)
+VERDICT_CACHE_SIZE = getattr(config, 'VERDICT_CACHE_SIZE', 5000)
+VERDICT_CACHE_TTL = getattr(config, 'VERDICT_CACHE_TTL', 6 * 60 * 60)
+
+# Файл для сохранения кэша между перезапусками (None - не сохранять)
+VERDICT_CACHE_FILE = getattr(config, 'VERDICT_CACHE_FILE', 'verdict_cache.json')
+
+
+class VerdictCache:
+    """
+    LRU-кэш вердиктов нейросети с временем жизни записей.
+    Ключ - (тип чата, версия промпта, сообщение после text_normalizer.simplify):
+    кэш получает готовый ключ и сам сообщения не нормализует.
+    """
+
+    def __init__(self, max_size=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL, filename=VERDICT_CACHE_FILE):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, verdict)
+        self._versions = {}  # chat_type -> текущая версия промпта
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, chat_type, prompt_version):
+        current = self._versions.get(chat_type)
+        if current != prompt_version:
+            if current is not None:
+                self.invalidate(chat_type, current)
+            self._versions[chat_type] = prompt_version
+
+    def get(self, chat_type, prompt_version, message_key):
+        self._check_version(chat_type, prompt_version)
+        key = (chat_type, prompt_version, message_key)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            metrics.verdict_cache_requests.inc(result='miss')
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.verdict_cache_requests.inc(result='hit')
+        return entry[1]
+
+    def put(self, chat_type, prompt_version, message_key, verdict):
+        self._check_version(chat_type, prompt_version)
+        key = (chat_type, prompt_version, message_key)
+        if verdict.raw is not None:
+            # Ответ нейросети нужен только журналу, в кэше он лишь занимал бы память
+            verdict = Verdict.from_dict(verdict.to_dict())
+        self._entries[key] = (time.time() + self.ttl, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    # Удаление всех записей, полученных со старой версией промпта
+    def invalidate(self, chat_type, prompt_version):
+        stale = [key for key in self._entries if key[0] == chat_type and key[1] == prompt_version]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            logging.info(f"Промпт для чата '{chat_type}' изменился, удалено {len(stale)} записей из кэша вердиктов")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+    # Живые записи для сохранения: [[тип чата, версия промпта, сообщение, срок, вердикт], ...]
+    def snapshot(self):
+        now = time.time()
+        return [[*key, expires_at, verdict.to_dict()] for key, (expires_at, verdict) in self._entries.items()
+                if expires_at >= now]
+
+    # current_version - функция chat_type -> текущая версия промпта: записи, полученные
+    # с промптом, который изменился, пока бот был остановлен, не восстанавливаются
+    def restore(self, entries, current_version=None):
+        now = time.time()
+        stale = 0
+        for chat_type, prompt_version, key, expires_at, verdict in entries[-self.max_size:]:
+            # Текстовые вердикты из старого формата кэша пропускаются
+            if expires_at < now or not isinstance(verdict, dict):
+                continue
+            if current_version is not None:
+                if chat_type not in self._versions:
+                    self._versions[chat_type] = current_version(chat_type)
+                if prompt_version != self._versions[chat_type]:
+                    stale += 1
+                    continue
+            self._entries[(chat_type, prompt_version, key)] = (expires_at, Verdict.from_dict(verdict))
+        if stale:
+            logging.info(f"Промпт изменился, пока бот был остановлен: пропущено {stale} записей кэша вердиктов")
+
+    def save(self):
+        if not self.filename:
+            return
+        entries = self.snapshot()
+        try:
+            tmp_filename = self.filename + '.tmp'
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_filename, self.filename)
+            logging.info(f"Кэш вердиктов сохранён: {len(entries)} записей")
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении кэша вердиктов: {e}")
+
+    def load(self, current_version=None):
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке кэша вердиктов: {e}")
+            return
+
+        self.restore(entries, current_version)
+        logging.info(f"Кэш вердиктов загружен: {len(self._entries)} записей")
+
+
+verdict_cache = VerdictCache()
+metrics.verdict_cache_size.set_function(lambda: len(verdict_cache))
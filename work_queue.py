@@ -0,0 +1,179 @@
+import time
+import asyncio
+import logging
+from collections import deque
+import config
+import metrics
+
+# Размер очереди сообщений на один сервер и число обработчиков
+QUEUE_MAX_SIZE = getattr(config, 'QUEUE_MAX_SIZE', 1000)
+QUEUE_WORKERS = getattr(config, 'QUEUE_WORKERS', 8)
+
+# Что делать при переполнении очереди:
+#   drop_oldest     - выбросить самое старое сообщение
+#   drop_non_global - в первую очередь выбрасывать сообщения не из глобального чата
+#   keyword_only    - новое сообщение проверяется только по спискам слов, без нейросети
+QUEUE_OVERFLOW_POLICY = getattr(config, 'QUEUE_OVERFLOW_POLICY', 'drop_oldest')
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_non_global', 'keyword_only')
+
+GLOBAL_CHANNEL = 'глобальный'
+
+
+class MessageQueue:
+    """
+    Ограниченная очередь сообщений чата одного сервера с фиксированным числом обработчиков.
+    Все созданные задачи хранятся в очереди, поэтому не теряются и не падают молча.
+    """
+
+    def __init__(self, name, handler, degraded_handler=None, max_size=QUEUE_MAX_SIZE, workers=QUEUE_WORKERS,
+                 overflow_policy=QUEUE_OVERFLOW_POLICY, on_done=None):
+        """
+        :param name: Название очереди (сервер) для логов
+        :param handler: Корутина обработки сообщения
+        :param degraded_handler: Корутина упрощённой обработки (для политики keyword_only)
+        :param max_size: Максимальное число ожидающих сообщений
+        :param workers: Число одновременно обрабатываемых сообщений
+        :param overflow_policy: Политика переполнения, одна из OVERFLOW_POLICIES
+        :param on_done: Функция (сообщение, выброшено ли), вызываемая для каждого сообщения
+                        после обработки или выбрасывания
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения очереди: {overflow_policy}")
+        if overflow_policy == 'keyword_only' and degraded_handler is None:
+            raise ValueError("Для политики keyword_only нужен degraded_handler")
+
+        self.name = name
+        self.handler = handler
+        self.degraded_handler = degraded_handler
+        self.max_size = max_size
+        self.worker_count = workers
+        self.overflow_policy = overflow_policy
+        self.on_done = on_done
+
+        self._items = deque()  # (время постановки, сообщение)
+        self._not_empty = asyncio.Event()
+        self._workers = []
+        self._tasks = set()  # Задачи упрощённой обработки при переполнении
+        self._active = 0
+
+        # Статистика
+        self.processed = 0
+        self.dropped = 0
+        self.degraded = 0
+        self.failed = 0
+        self.max_wait = 0.0
+        self._total_wait = 0.0
+        self._dequeued = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        metrics.queue_depth.set_function(lambda: len(self._items), server=self.name)
+        for number in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"{self.name}-worker-{number}"))
+
+    def put(self, item):
+        if len(self._items) >= self.max_size:
+            item = self._handle_overflow(item)
+            if item is None:
+                return
+        self._items.append((time.monotonic(), item))
+        self._not_empty.set()
+
+    # Возвращает сообщение, которое нужно поставить в очередь, или None
+    def _handle_overflow(self, item):
+        if (self.dropped + self.degraded) % 100 == 0:
+            logging.warning(f"Очередь {self.name} переполнена ({len(self._items)}), политика {self.overflow_policy}")
+
+        if self.overflow_policy == 'keyword_only':
+            self.degraded += 1
+            metrics.queue_dropped.inc(server=self.name, action='keyword_only')
+            self._track(asyncio.create_task(self._run(self.degraded_handler, item)))
+            return None
+
+        if self.overflow_policy == 'drop_non_global':
+            if item.channel.lower() != GLOBAL_CHANNEL:
+                self._drop(item)
+                return None
+            for queued in self._items:
+                if queued[1].channel.lower() != GLOBAL_CHANNEL:
+                    self._items.remove(queued)
+                    self._drop(queued[1])
+                    return item
+
+        self._drop(self._items.popleft()[1])
+        return item
+
+    def _drop(self, item):
+        self.dropped += 1
+        metrics.queue_dropped.inc(server=self.name, action='dropped')
+        self._done(item, dropped=True)
+
+    def _done(self, item, dropped=False):
+        if self.on_done is not None:
+            self.on_done(item, dropped)
+
+    def _track(self, task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, handler, item):
+        try:
+            await handler(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+            logging.exception(f"Ошибка при обработке сообщения в очереди {self.name}: {item}")
+        self._done(item)
+
+    async def _worker(self):
+        while True:
+            while not self._items:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+
+            enqueued_at, item = self._items.popleft()
+            wait = time.monotonic() - enqueued_at
+            self._dequeued += 1
+            self._total_wait += wait
+            metrics.queue_wait.observe(wait, server=self.name)
+            self.max_wait = max(self.max_wait, wait)
+
+            self._active += 1
+            try:
+                await self._run(self.handler, item)
+            finally:
+                self._active -= 1
+                self.processed += 1
+
+    def stats(self):
+        return {
+            "depth": len(self._items),
+            "active": self._active,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "degraded": self.degraded,
+            "failed": self.failed,
+            "avg_wait": self._total_wait / self._dequeued if self._dequeued else 0.0,
+            "max_wait": self.max_wait
+        }
+
+    # Ожидание обработки всех сообщений в очереди
+    async def join(self):
+        while self._items or self._active or self._tasks:
+            await asyncio.sleep(0.05)
+
+    async def stop(self, timeout=None):
+        if timeout:
+            try:
+                await asyncio.wait_for(self.join(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Очередь {self.name}: не успели обработать {len(self._items)} сообщений")
+
+        for task in self._workers + list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._tasks, return_exceptions=True)
+        self._workers.clear()
+        metrics.queue_depth.remove(server=self.name)